@@ -0,0 +1,44 @@
+#!/bin/env python3
+"""Atomic replacement of output files
+
+The content is written into a temporary file with a unique name in the
+directory of the target and renamed into place, so concurrent readers and
+writers see either the old or the new file, never a partial one. mkstemp()
+creates the temporary file readable by the owner only, it gets the mode of a
+file created with open() before it is renamed.
+"""
+
+import contextlib
+import os
+import tempfile
+
+
+def _default_mode():
+    # the umask can only be read by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+DEFAULT_MODE = _default_mode()
+
+
+@contextlib.contextmanager
+def atomic_write(filename, mode='wb', sync=True):
+    """Open a temporary file for writing that replaces filename when the block ends without an exception
+
+    With sync the content is flushed to the disk before the file is renamed.
+    """
+    directory = os.path.dirname(filename) or '.'
+    fd, tmp_filename = tempfile.mkstemp(prefix='.' + os.path.basename(filename), suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_filename, DEFAULT_MODE)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
@@ -0,0 +1,413 @@
+#!/bin/env python3
+"""Benchmark of the register model without the reference manual
+
+Synthetic bit overview and bit description tables are generated as data
+frames, like the extractor returns them: fields spanning several columns
+with the name only in their first column, fields crossing bit 16 with the
+bit range in the name, Reserved fields and Reserved cells that took the bit
+numbers of their neighbour columns. Every model operation is timed on its
+own and the result is checked against the generated layout. With a
+baseline file the throughput is compared to an earlier run.
+
+    python src/benchmark.py --registers 1000,10000,30000 --save-baseline bench.json
+    python src/benchmark.py --registers 1000,10000,30000 --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from parse_sim3u import parse_reg_bit_description, parse_reg_bit_overview
+from peripheral import Peripheral
+from register import Register, RegisterBitTableEntry, RegisterBitTableEntryCollection
+from svd import SvdGenerator
+import svd_diff
+
+REGISTERS_PER_PERIPHERAL = 16
+BASE_ADDRESS = 0x40000000
+
+OPERATIONS = ('overview', 'append', 'description', 'add_bit_info', 'calc_reset_values', 'enum_values',
+              'calc_xml_values', 'register_xml', 'svd')
+
+
+class Field:
+    def __init__(self, name, msb, lsb, access, reset, function=None, enums=()):
+        self.name = name
+        self.msb = msb
+        self.lsb = lsb
+        self.access = access
+        self.reset = reset  # one value per bit, 'X' for undefined
+        self.function = function
+        self.enums = enums  # (usage, value) of the enumerated values
+        self.merged_bits = 0  # bit numbers of the following columns in the cell of the last column
+
+    def bits(self):
+        return list(range(self.msb, self.lsb - 1, -1))
+
+
+class Layout:
+    """Generated register, the reference the parsed model is checked against"""
+
+    def __init__(self, name, address, fields, modify_external, has_set, has_clr):
+        self.name = name
+        self.address = address
+        self.fields = fields
+        self.modify_external = modify_external
+        self.has_set = has_set
+        self.has_clr = has_clr
+
+    def reset_values(self):
+        reset_value = 0
+        reset_mask = 0
+        for f in self.fields:
+            for bit, reset in zip(f.bits(), f.reset):
+                reset_mask |= 1 << bit
+                reset_value |= (1 if reset == '1' else 0) << bit
+        return reset_value, reset_mask
+
+
+def _function(rng, name, width):
+    lines = ["Controls {}.".format(name.lower())]
+    enums = []
+    usages = [('read-write', None)] if rng.random() < 0.8 else [('read', 'Read:'), ('write', 'Write:')]
+    for usage, header in usages:
+        if header:
+            lines.append(header)
+        for value in range(min(1 << width, rng.choice([0, 2, 2, 4]))):
+            text = format(value, '0{}b'.format(width))
+            lines.append("{}: {} {} of the module.".format(text, rng.choice(["Enable", "Disable", "Select"]), value))
+            enums.append((usage, "0b" + text))
+    return "\n".join(lines), enums
+
+
+def _reset(rng, width, reserved=False):
+    return ['0' if reserved else rng.choice('0001X') for i in range(width)]
+
+
+def generate_layout(rng, name, address):
+    has_set = rng.random() < 0.5
+    has_clr = has_set and rng.random() < 0.8
+    if rng.random() < 0.1:
+        function, enums = "Data of the module.", []
+        field = Field('DATA', 31, 0, 'RW', _reset(rng, 32), function, enums)
+        return Layout(name, address, [field], False, has_set, has_clr)
+
+    fields = []
+    bit = 31
+    while bit >= 0:
+        width = min(rng.choice([1, 1, 1, 2, 3, 4, 8, 12]), bit + 1)
+        lsb = bit - width + 1
+        reserved = rng.random() < 0.3 and not (fields and fields[-1].name == 'Reserved')
+        if reserved:
+            fields.append(Field('Reserved', bit, lsb, 'R', _reset(rng, width, True)))
+            # the bit numbers of a neighbour Reserved column are sometimes put into this cell
+            half_lsb = 16 if lsb >= 16 else 0
+            if bit >= 16 > lsb or lsb - half_lsb < 2 or rng.random() < 0.5:
+                bit = lsb - 1
+                continue
+            merged = rng.randint(1, min(3, lsb - half_lsb))
+            fields[-1].merged_bits = merged
+            fields.append(Field('Reserved', lsb - 1, lsb - merged, 'RW', _reset(rng, merged, True)))
+            bit = lsb - merged - 1
+            continue
+        field_name = 'F{}'.format(bit)
+        function, enums = _function(rng, field_name, width)
+        fields.append(Field(field_name, bit, lsb, rng.choice(['RW', 'RW', 'R', 'W']), _reset(rng, width),
+                            function, enums))
+        bit = lsb - 1
+    return Layout(name, address, fields, rng.random() < 0.05, has_set, has_clr)
+
+
+def _columns(layout):
+    """Cells (bit, name, access, reset) of the 32 bit columns, from bit 31 to 0"""
+    columns = dict()
+    skip = set()
+    for f in layout.fields:
+        for bit in f.bits():
+            if bit in skip:
+                # the bit number is in the cell of the neighbour column, the name
+                # is missing and the access is given in the first column only
+                columns[bit] = ['', '', f.access if bit == f.msb else '', f.reset[f.msb - bit]]
+                continue
+            first = bit == f.msb or bit == 15
+            name = ''
+            if first:
+                name = f.name
+                if f.msb >= 16 > f.lsb and f.name != 'Reserved':
+                    # the halves of a field crossing bit 16 are named with their bit range
+                    if bit == 15:
+                        name += '[{}:0]'.format(15 - f.lsb)
+                    else:
+                        name += '[{}:{}]'.format(f.msb - f.lsb, 16 - f.lsb)
+            text = str(bit)
+            if bit == f.lsb and f.merged_bits:
+                text = " ".join(str(b) for b in range(bit, bit - f.merged_bits - 1, -1))
+                skip.update(range(bit - 1, bit - f.merged_bits - 1, -1))
+            columns[bit] = [text, name, f.access if first else '', f.reset[f.msb - bit]]
+    return [columns[b] for b in range(31, -1, -1)]
+
+
+def overview_frame(peripheral_name, layout):
+    import pandas
+
+    columns = _columns(layout)
+    rows = [['Bit'] + [c[0] for c in columns[:16]],
+            ['Name'] + [c[1] for c in columns[:16]],
+            ['Type'] + [c[2] for c in columns[:16]],
+            ['Reset'] + [c[3] for c in columns[:16]],
+            [''] * 17,
+            ['Bit'] + [c[0] for c in columns[16:]],
+            ['Name'] + [c[1] for c in columns[16:]],
+            ['Type'] + [c[2] for c in columns[16:]],
+            ['Reset'] + [c[3] for c in columns[16:]],
+            ["Register ALL Access Address\n{}_{} = 0x{:04X}_{:04X}".format(
+                peripheral_name, layout.name, layout.address >> 16, layout.address & 0xFFFF)] + [''] * 16]
+    return pandas.DataFrame(rows)
+
+
+def _description_rows(layout):
+    rows = []
+    fields = list(layout.fields)
+    while fields:
+        f = fields.pop(0)
+        lsb = f.lsb
+        if f.name == 'Reserved':
+            # neighbour Reserved fields are described in one row
+            while fields and fields[0].name == 'Reserved':
+                lsb = fields.pop(0).lsb
+        bits = "{}:{}".format(f.msb, lsb) if f.msb != lsb else str(f.msb)
+        rows.append([bits, f.name, f.function if f.function else "Must write reset value."])
+    if layout.modify_external:
+        rows.append(["Reads of this register modify the state of hardware.", '', ''])
+    return rows
+
+
+def description_frame(layout):
+    import pandas
+
+    return pandas.DataFrame([['Bit', 'Name', 'Function']] + _description_rows(layout))
+
+
+class Workload:
+    def __init__(self, register_count, seed=1):
+        rng = random.Random(seed)
+        self.peripherals = []
+        for p in range((register_count + REGISTERS_PER_PERIPHERAL - 1) // REGISTERS_PER_PERIPHERAL):
+            name = 'BENCH{}'.format(p)
+            count = min(REGISTERS_PER_PERIPHERAL, register_count - p * REGISTERS_PER_PERIPHERAL)
+            base = BASE_ADDRESS + p * 0x1000
+            layouts = [generate_layout(rng, 'REG{}'.format(i), base + 0x10 * i) for i in range(count)]
+            frames = [(overview_frame(name, l), description_frame(l), _columns(l), _description_rows(l))
+                      for l in layouts]
+            self.peripherals.append((name, layouts, frames))
+        self.register_count = register_count
+
+    def model(self):
+        """New peripherals with registers without bits, as after parsing the memory map"""
+        peripherals = dict()
+        for name, layouts, frames in self.peripherals:
+            peripheral = Peripheral(name)
+            for l in layouts:
+                peripheral.add_register(Register(l.name, l.name, l.address, l.has_set, l.has_clr))
+            peripherals[name] = peripheral
+        return peripherals
+
+
+class Timer:
+    def __init__(self):
+        self.seconds = dict()
+
+    @contextlib.contextmanager
+    def measure(self, operation):
+        start = time.perf_counter()
+        yield
+        self.seconds[operation] = time.perf_counter() - start
+
+
+def run_operations(workload, timer):
+    """Execute all operations on a new model, return the model and the svd"""
+    peripherals = workload.model()
+    items = [(peripherals[name], layouts, frames) for name, layouts, frames in workload.peripherals]
+
+    with timer.measure('overview'):
+        for peripheral, layouts, frames in items:
+            for overview, _, _, _ in frames:
+                parse_reg_bit_overview(peripheral, overview)
+
+    with timer.measure('append'):
+        appended = []
+        for peripheral, layouts, frames in items:
+            for _, _, columns, _ in frames:
+                collection = RegisterBitTableEntryCollection()
+                for column in columns:
+                    collection.append(RegisterBitTableEntry(column))
+                appended.append(collection)
+
+    with timer.measure('description'):
+        for peripheral, layouts, frames in items:
+            for l, (_, description, _, _) in zip(layouts, frames):
+                parse_reg_bit_description(peripheral.registers[l.name], description)
+
+    with timer.measure('add_bit_info'):
+        for peripheral, layouts, frames in items:
+            for l, (_, _, _, rows) in zip(layouts, frames):
+                register = peripheral.registers[l.name]
+                for bits, name, function in rows:
+                    if name:
+                        msb, _, lsb = bits.partition(':')
+                        register.add_bit_info(list(range(int(msb), int(lsb or msb) - 1, -1)), name, function)
+
+    with timer.measure('calc_reset_values'):
+        for peripheral, layouts, frames in items:
+            for register in peripheral.registers.values():
+                register.bits.calc_reset_values()
+
+    with timer.measure('enum_values'):
+        for peripheral, layouts, frames in items:
+            for register in peripheral.registers.values():
+                for entry in register.bits.entries:
+                    entry.get_enum_values()
+
+    with timer.measure('calc_xml_values'):
+        for peripheral, layouts, frames in items:
+            peripheral._calc_xml_values()
+
+    with timer.measure('register_xml'):
+        for peripheral, layouts, frames in items:
+            registers_element = ET.Element('registers')
+            for register in peripheral.registers.values():
+                register.xml_append(registers_element, peripheral.base_address)
+
+    with timer.measure('svd'):
+        svd = ET.tostring(SvdGenerator(peripherals).build().getroot())
+    return peripherals, appended, svd
+
+
+def _entries(collection):
+    return [(e.name, e.bits, e.access, e.reset) for e in collection.entries]
+
+
+def _expected_entries(layout):
+    return [(f.name, f.bits(), f.access, [1 if r == '1' else 0 for r in f.reset]) for f in layout.fields]
+
+
+def check(workload, peripherals, appended, svd):
+    """Compare the model and the svd with the generated layouts, return the differences"""
+    problems = []
+    index = svd_diff.index_svd(ET.fromstring(svd))
+    appended = iter(appended)
+    for name, layouts, frames in workload.peripherals:
+        peripheral = peripherals[name]
+        if peripheral.base_address != layouts[0].address:
+            problems.append("{}: base address {:#x}".format(name, peripheral.base_address))
+        for l in layouts:
+            path = "{}/{}".format(name, l.name)
+            register = peripheral.registers[l.name]
+            if _entries(next(appended)) != _expected_entries(l):
+                problems.append("{}: entries of append differ".format(path))
+            reset_value, reset_mask = l.reset_values()
+            if (register.reset_value, register.reset_mask) != (reset_value, reset_mask):
+                problems.append("{}: reset {:#x}/{:#x}, expected {:#x}/{:#x}".format(
+                    path, register.reset_value, register.reset_mask, reset_value, reset_mask))
+            if path not in index or int(index[path]['resetValue'], 0) != reset_value:
+                problems.append("{}: missing or wrong in the svd".format(path))
+            if l.modify_external and index.get(path, {}).get('readAction') != 'modifyExternal':
+                problems.append("{}: read action missing".format(path))
+            for f in l.fields:
+                if f.name == 'Reserved' or len(l.fields) == 1:
+                    continue
+                field = index.get("{}/{}".format(path, f.name))
+                if field is None or (int(field['bitOffset']), int(field['bitWidth'])) != (f.lsb, f.msb - f.lsb + 1):
+                    problems.append("{}/{}: field missing or at the wrong bits".format(path, f.name))
+                    continue
+                for usage, value in f.enums:
+                    if "{}/{}/{}/{}".format(path, f.name, usage, value) not in index:
+                        problems.append("{}/{}: enumerated value {} {} missing".format(path, f.name, usage, value))
+    return problems
+
+
+def benchmark(register_counts, repeat):
+    """Return the best throughput in registers per second by operation and register count"""
+    results = dict((op, dict()) for op in OPERATIONS)
+    for count in register_counts:
+        workload = Workload(count)
+        for i in range(repeat):
+            timer = Timer()
+            # the parser reports every parsed function on stdout
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                peripherals, appended, svd = run_operations(workload, timer)
+            if i == 0:
+                problems = check(workload, peripherals, appended, svd)
+                if problems:
+                    raise Exception("Model differs from the reference for {} registers:\n{}".format(
+                        count, "\n".join(problems[:20])))
+            for op, seconds in timer.seconds.items():
+                throughput = count / seconds if seconds else float('inf')
+                results[op][str(count)] = max(results[op].get(str(count), 0.0), throughput)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return the operations whose throughput is more than threshold below the baseline"""
+    regressions = []
+    for op, by_count in results.items():
+        for count, throughput in by_count.items():
+            reference = baseline.get(op, {}).get(count)
+            if reference and throughput < reference * (1 - threshold):
+                regressions.append("{} with {} registers: {:.0f}/s, baseline {:.0f}/s".format(
+                    op, count, throughput, reference))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmark the register model with synthetic tables')
+
+    parser.add_argument("--registers", default="100,1000,10000",
+                        help="Comma separated numbers of registers to benchmark with")
+
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs per register count, the fastest one counts")
+
+    parser.add_argument("--baseline", default=None, metavar="FILE",
+                        help="Fail if the throughput of an operation is below the one in FILE")
+
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative throughput loss compared to the baseline")
+
+    parser.add_argument("--save-baseline", default=None, metavar="FILE",
+                        help="Write the throughput to FILE")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    register_counts = [int(c) for c in args.registers.split(',')]
+    results = benchmark(register_counts, args.repeat)
+
+    print("{:<20}".format("registers/s") + "".join("{:>12}".format(c) for c in register_counts))
+    for op in OPERATIONS:
+        print("{:<20}".format(op) + "".join("{:>12.0f}".format(results[op][str(c)]) for c in register_counts))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print("Regression: {}".format(r))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/bin/env python3
+"""Compact binary device description for fast lookups
+
+The file is written from the peripheral model and read with mmap, lookups
+unpack only the records they need, nothing is parsed at startup. All values
+are little endian, the layout is:
+
+- header: magic, version, record counts and section offsets
+- peripherals sorted by name: name, description, base address, size, first
+  register, register count, index of the peripheral it is derived from
+- registers, sorted by name within their peripheral: name, description,
+  address, reset value, reset mask, peripheral, first field, field count,
+  flags (has SET/CLR/MSK register, cluster)
+- fields, ordered by bit offset within their register: name, access, mask,
+  bit offset, bit width
+- address index sorted by address: address, register, kind (the register
+  itself or its SET/CLR/MSK register)
+- string table: every string once, a 16 bit length followed by the utf-8
+  bytes, strings are referenced by their offset in the table
+
+Registers of derived peripherals without own fields share the fields of the
+register with the same name in the base peripheral.
+"""
+
+import logging
+import mmap
+import struct
+
+from atomic_file import atomic_write
+from register import Register
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SIM3UDEV'
+VERSION = 1
+
+HEADER = struct.Struct('<8sIIIIIIIIII')
+PERIPHERAL = struct.Struct('<IIIIIII')
+REGISTER = struct.Struct('<IIIIIIIHH')
+FIELD = struct.Struct('<IIIBBH')
+ADDRESS = struct.Struct('<III')
+
+NONE = 0xFFFFFFFF
+
+FLAG_SET = 1
+FLAG_CLR = 2
+FLAG_MSK = 4
+FLAG_CLUSTER = 8
+SPECIAL_FLAGS = {'SET': FLAG_SET, 'CLR': FLAG_CLR, 'MSK': FLAG_MSK}
+
+# kinds of the address index: the register itself or its SET, CLR, MSK register
+KINDS = ('',) + tuple(postfix for postfix, offset, flag in Register.SPECIAL_REGISTERS)
+
+
+class _StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = dict()
+
+    def add(self, text):
+        text = text or ''
+        if text not in self.offsets:
+            encoded = text.encode('utf-8')[:0xFFFF]
+            self.offsets[text] = len(self.data)
+            self.data += struct.pack('<H', len(encoded)) + encoded
+        return self.offsets[text]
+
+
+def _is_single_field(register):
+    return bool(register.bits) and register.bits.has_only_one_32bit_field()
+
+
+def _fields(register):
+    """Entries of the register as written to the svd file"""
+    if not register.bits or _is_single_field(register):
+        return []
+    entries = [e for e in register.bits.entries if e.name != 'Reserved']
+    return sorted(entries, key=lambda e: e.bits[-1])
+
+
+def _register_values(register):
+    """Description, reset value, reset mask and cluster flag like Register.xml_append() without changing the model"""
+    description = register.description
+    is_cluster = register.is_cluster
+    if _is_single_field(register):
+        description = description or register.bits.get_description_of_entry(0)
+        is_cluster = is_cluster or 'should always access' in register.bits.get_function_of_entry(0)
+    if register.bits:
+        reset_value, reset_mask = register.bits.calc_reset_values()
+    else:
+        reset_value, reset_mask = register.reset_value or 0, register.reset_mask or 0
+    return description or register.title, reset_value, reset_mask, is_cluster
+
+
+def write_device_description(peripherals, filename):
+    """Compile the peripherals into the binary device description filename"""
+    strings = _StringTable()
+    ordered = sorted(peripherals.values(), key=lambda p: p.name.encode('utf-8'))
+    peripheral_index = dict((p.name, i) for i, p in enumerate(ordered))
+
+    peripheral_records = []
+    register_records = []
+    field_records = []
+    addresses = []
+    # first field and field count of the registers by peripheral and register name
+    register_fields = dict()
+
+    def add_fields(register):
+        first = len(field_records)
+        for e in _fields(register):
+            offset = e.bits[-1]
+            width = e.bits[0] - e.bits[-1] + 1
+            mask = ((1 << width) - 1) << offset
+            field_records.append(FIELD.pack(strings.add(e.name), strings.add(e.access), mask, offset, width, 0))
+        return first, len(field_records) - first
+
+    for p in ordered:
+        if p.registers:
+            p._calc_xml_values()
+        for r in p.registers.values():
+            register_fields[(p.name, r.name)] = add_fields(r)
+
+    for i, p in enumerate(ordered):
+        registers = sorted(p.registers.values(), key=lambda r: r.name.encode('utf-8'))
+        derived_from = peripheral_index.get(p.derived_from, NONE)
+        peripheral_records.append(PERIPHERAL.pack(strings.add(p.name), strings.add(p.description), p.base_address,
+                                                  p.block_size, len(register_records), len(registers), derived_from))
+        for r in registers:
+            first_field, field_count = register_fields[(p.name, r.name)]
+            if not field_count and p.derived_from and (p.derived_from, r.name) in register_fields:
+                first_field, field_count = register_fields[(p.derived_from, r.name)]
+            description, reset_value, reset_mask, is_cluster = _register_values(r)
+            flags = FLAG_CLUSTER if is_cluster else 0
+            for postfix, offset in r.special_registers():
+                flags |= SPECIAL_FLAGS[postfix]
+            register_index = len(register_records)
+            register_records.append(REGISTER.pack(strings.add(r.name), strings.add(description),
+                                                  r.address, reset_value, reset_mask, i, first_field,
+                                                  field_count, flags))
+            addresses.append((r.address, register_index, 0))
+            for postfix, offset in r.special_registers():
+                addresses.append((r.address + offset, register_index, KINDS.index(postfix)))
+
+    addresses.sort()
+    sections = [b''.join(peripheral_records), b''.join(register_records), b''.join(field_records),
+                b''.join(ADDRESS.pack(*a) for a in addresses), bytes(strings.data)]
+    offsets = []
+    offset = HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    header = HEADER.pack(MAGIC, VERSION, len(peripheral_records), len(register_records), len(field_records),
+                         len(addresses), *offsets)
+
+    with atomic_write(filename) as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    logger.info("Wrote {} peripherals, {} registers and {} fields to {}".format(
+        len(peripheral_records), len(register_records), len(field_records), filename))
+
+
+class FieldView:
+    __slots__ = ('device', 'index')
+
+    def __init__(self, device, index):
+        self.device = device
+        self.index = index
+
+    def _record(self):
+        return FIELD.unpack_from(self.device.buffer, self.device.fields_offset + self.index * FIELD.size)
+
+    @property
+    def name(self):
+        return self.device.string(self._record()[0])
+
+    @property
+    def access(self):
+        return self.device.string(self._record()[1])
+
+    @property
+    def mask(self):
+        return self._record()[2]
+
+    @property
+    def bit_offset(self):
+        return self._record()[3]
+
+    @property
+    def bit_width(self):
+        return self._record()[4]
+
+    def __repr__(self):
+        return "Field {} bits {}+{}".format(self.name, self.bit_offset, self.bit_width)
+
+
+class RegisterView:
+    __slots__ = ('device', 'index')
+
+    def __init__(self, device, index):
+        self.device = device
+        self.index = index
+
+    def _record(self):
+        return REGISTER.unpack_from(self.device.buffer, self.device.registers_offset + self.index * REGISTER.size)
+
+    @property
+    def name(self):
+        return self.device.string(self._record()[0])
+
+    @property
+    def description(self):
+        return self.device.string(self._record()[1])
+
+    @property
+    def address(self):
+        return self._record()[2]
+
+    @property
+    def reset_value(self):
+        return self._record()[3]
+
+    @property
+    def reset_mask(self):
+        return self._record()[4]
+
+    @property
+    def peripheral(self):
+        return PeripheralView(self.device, self._record()[5])
+
+    @property
+    def flags(self):
+        return self._record()[8]
+
+    def fields(self):
+        record = self._record()
+        return [FieldView(self.device, i) for i in range(record[6], record[6] + record[7])]
+
+    def field(self, name):
+        for f in self.fields():
+            if f.name == name:
+                return f
+        raise KeyError("{} has no field {}".format(self.name, name))
+
+    def __repr__(self):
+        return "Register {} at {:#010x}".format(self.name, self.address)
+
+
+class PeripheralView:
+    __slots__ = ('device', 'index')
+
+    def __init__(self, device, index):
+        self.device = device
+        self.index = index
+
+    def _record(self):
+        return PERIPHERAL.unpack_from(self.device.buffer,
+                                      self.device.peripherals_offset + self.index * PERIPHERAL.size)
+
+    @property
+    def name(self):
+        return self.device.string(self._record()[0])
+
+    @property
+    def description(self):
+        return self.device.string(self._record()[1])
+
+    @property
+    def base_address(self):
+        return self._record()[2]
+
+    @property
+    def size(self):
+        return self._record()[3]
+
+    @property
+    def derived_from(self):
+        index = self._record()[6]
+        return PeripheralView(self.device, index) if index != NONE else None
+
+    def registers(self):
+        record = self._record()
+        return [RegisterView(self.device, i) for i in range(record[4], record[4] + record[5])]
+
+    def register(self, name):
+        record = self._record()
+        index = self.device._find(REGISTER, self.device.registers_offset, record[4], record[4] + record[5],
+                                  name)
+        if index is None:
+            raise KeyError("{} has no register {}".format(self.name, name))
+        return RegisterView(self.device, index)
+
+    def __repr__(self):
+        return "Peripheral {} at {:#010x}".format(self.name, self.base_address)
+
+
+class DeviceDescription:
+    """Reader of a binary device description, the file is mapped into memory"""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        (magic, version, self.peripheral_count, self.register_count, self.field_count, self.address_count,
+         self.peripherals_offset, self.registers_offset, self.fields_offset, self.addresses_offset,
+         self.strings_offset) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise Exception("{} is no device description of version {}".format(filename, VERSION))
+
+    def close(self):
+        self.buffer.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, offset):
+        start = self.strings_offset + offset
+        length, = struct.unpack_from('<H', self.buffer, start)
+        return bytes(self.buffer[start + 2:start + 2 + length]).decode('utf-8')
+
+    def _name_bytes(self, record_struct, section_offset, index):
+        offset = self.strings_offset + record_struct.unpack_from(self.buffer, section_offset +
+                                                                 index * record_struct.size)[0]
+        length, = struct.unpack_from('<H', self.buffer, offset)
+        return self.buffer[offset + 2:offset + 2 + length].tobytes()
+
+    def _find(self, record_struct, section_offset, first, end, name):
+        """Binary search of the record named name in the records first to end, sorted by name"""
+        key = name.encode('utf-8')
+        low, high = first, end
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_bytes(record_struct, section_offset, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < end and self._name_bytes(record_struct, section_offset, low) == key:
+            return low
+        return None
+
+    def peripherals(self):
+        return [PeripheralView(self, i) for i in range(self.peripheral_count)]
+
+    def peripheral(self, name):
+        index = self._find(PERIPHERAL, self.peripherals_offset, 0, self.peripheral_count, name)
+        if index is None:
+            raise KeyError("No peripheral {}".format(name))
+        return PeripheralView(self, index)
+
+    def register(self, peripheral_name, register_name):
+        return self.peripheral(peripheral_name).register(register_name)
+
+    def register_at(self, address):
+        """Return the register at the address and its kind ('' or SET/CLR/MSK), None if there is none"""
+        low, high = 0, self.address_count
+        while low < high:
+            middle = (low + high) // 2
+            if ADDRESS.unpack_from(self.buffer, self.addresses_offset + middle * ADDRESS.size)[0] < address:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.address_count:
+            return None
+        found, index, kind = ADDRESS.unpack_from(self.buffer, self.addresses_offset + low * ADDRESS.size)
+        if found != address:
+            return None
+        return RegisterView(self, index), KINDS[kind]
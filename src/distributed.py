@@ -0,0 +1,258 @@
+#!/bin/env python3
+"""Distribute extraction jobs to worker processes on other build nodes
+
+The coordinator listens on a socket and hands out jobs to the workers that
+connect to it. A worker asks for a job, executes it and sends the result
+back. Jobs of workers that lose the connection are handed out again, up to
+MAX_ATTEMPTS times, a job that kills every worker it is given fails instead.
+Messages are pickled python objects, the connection is authenticated with
+a shared key. Anybody who knows the key can run code on the coordinator and
+the workers, so there is no default key: it is either given by the user or
+generated for workers on the local host only.
+"""
+
+import collections
+import ipaddress
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger(__name__)
+
+# seconds a worker waits before asking again when no job is available
+IDLE_INTERVAL = 0.5
+
+# times a job is handed out before a lost worker connection fails it
+MAX_ATTEMPTS = 3
+
+# seconds between two checks of the local workers while waiting for the jobs
+WORKER_CHECK_INTERVAL = 1.0
+
+
+def parse_address(address):
+    """Convert HOST:PORT into a tuple, the host defaults to localhost"""
+    host, _, port = address.rpartition(':')
+    return host if host else 'localhost', int(port)
+
+
+def generate_authkey():
+    """Random key for a coordinator that only serves workers on the local host"""
+    return os.urandom(32)
+
+
+def is_loopback(host):
+    """True if all addresses of host are loopback addresses, i.e. it cannot be reached from other hosts"""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None)]
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(a.split('%')[0]).is_loopback for a in addresses)
+
+
+class JobError:
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class Coordinator:
+    def __init__(self, address, authkey):
+        self.authkey = authkey
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.pending = collections.deque()
+        self.running = dict()
+        self.results = dict()
+        self.callbacks = dict()
+        self.attempts = collections.Counter()
+        self.connections = 0
+        self.next_job_id = 0
+        self.shutdown = False
+        self.condition = threading.Condition()
+        self.local_workers = []
+
+    def start(self):
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+        logger.info("Coordinator listening on {}:{}".format(*self.address))
+
+    def start_local_workers(self, count, handler):
+        """Start worker processes on this host, mainly for testing, handler.close() is called when they end"""
+        for i in range(count):
+            process = multiprocessing.Process(target=_run_local_worker, args=(self.address, handler, self.authkey),
+                                              daemon=True)
+            process.start()
+            self.local_workers.append(process)
+
+    def submit(self, payload, on_done=None):
+        """Queue a job, on_done(result) is called in a coordinator thread as soon as it is done"""
+        with self.condition:
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            if on_done is not None:
+                self.callbacks[job_id] = on_done
+            self.pending.append((job_id, payload))
+        return job_id
+
+    def wait(self):
+        """Wait until all submitted jobs are done and return the results by job id
+
+        Jobs that raised an exception in the worker, lost their worker MAX_ATTEMPTS
+        times or were still pending when all local workers had exited have a JobError
+        as result. Without local workers, wait() waits for workers to connect.
+        """
+        with self.condition:
+            while self.pending or self.running:
+                self.condition.wait(WORKER_CHECK_INTERVAL)
+                if self.pending and not self._workers_alive():
+                    logger.error("No workers left, {} jobs cannot run".format(len(self.pending)))
+                    while self.pending:
+                        job_id, payload = self.pending.popleft()
+                        self._fail_job(job_id, "No worker left to run the job")
+            return dict(self.results)
+
+    def _workers_alive(self):
+        if not self.local_workers:
+            return True
+        return self.connections > 0 or any(p.is_alive() for p in self.local_workers)
+
+    def _fail_job(self, job_id, message):
+        self._call_back(job_id, JobError(message))
+        with self.condition:
+            self.running.pop(job_id, None)
+            self.results[job_id] = JobError(message)
+            self.condition.notify_all()
+
+    def close(self):
+        """Stop the workers after their current job, jobs that are not handed out yet are dropped"""
+        with self.condition:
+            self.shutdown = True
+            self.pending.clear()
+        for process in self.local_workers:
+            process.join()
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                # listener was closed
+                return
+            except Exception as e:
+                logger.warning("Rejected worker connection: {}".format(e))
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _next_message(self, connection):
+        with self.condition:
+            if self.pending:
+                job_id, payload = self.pending.popleft()
+                self.running[job_id] = (connection, payload)
+                self.attempts[job_id] += 1
+                return ('job', job_id, payload)
+            if self.shutdown:
+                return ('shutdown',)
+            return ('idle',)
+
+    def _requeue_jobs_of(self, connection):
+        failed = []
+        with self.condition:
+            for job_id, (c, payload) in list(self.running.items()):
+                if c is not connection:
+                    continue
+                if self.attempts[job_id] >= MAX_ATTEMPTS:
+                    logger.error("Worker connection lost, job {} failed {} times".format(job_id, MAX_ATTEMPTS))
+                    failed.append(job_id)
+                    continue
+                logger.warning("Worker connection lost, job {} is handed out again".format(job_id))
+                del self.running[job_id]
+                self.pending.appendleft((job_id, payload))
+        for job_id in failed:
+            self._fail_job(job_id, "Worker connection lost in all {} attempts".format(MAX_ATTEMPTS))
+
+    def _call_back(self, job_id, result):
+        # before the job is marked as done, so wait() returns only after all callbacks
+        with self.condition:
+            on_done = self.callbacks.pop(job_id, None)
+        if on_done is None:
+            return
+        try:
+            on_done(result)
+        except Exception:
+            logger.exception("Callback of job {} failed".format(job_id))
+
+    def _serve(self, connection):
+        with self.condition:
+            self.connections += 1
+        try:
+            while True:
+                message = connection.recv()
+                if message[0] == 'request':
+                    reply = self._next_message(connection)
+                    connection.send(reply)
+                    if reply[0] == 'shutdown':
+                        return
+                elif message[0] in ('result', 'error'):
+                    job_id = message[1]
+                    result = message[2] if message[0] == 'result' else JobError(message[2])
+                    self._call_back(job_id, result)
+                    with self.condition:
+                        self.running.pop(job_id, None)
+                        self.results[job_id] = result
+                        self.condition.notify_all()
+        except (EOFError, OSError):
+            self._requeue_jobs_of(connection)
+            with self.condition:
+                self.condition.notify_all()
+        finally:
+            connection.close()
+            with self.condition:
+                self.connections -= 1
+                self.condition.notify_all()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _run_local_worker(address, handler, authkey):
+    try:
+        run_worker(address, handler, authkey)
+    finally:
+        handler.close()
+
+
+def run_worker(address, handler, authkey):
+    """Execute jobs from the coordinator at address with handler(payload) until it shuts down"""
+    connection = Client(address, authkey=authkey)
+    try:
+        while True:
+            connection.send(('request',))
+            message = connection.recv()
+            if message[0] == 'shutdown':
+                return
+            if message[0] == 'idle':
+                time.sleep(IDLE_INTERVAL)
+                continue
+            _, job_id, payload = message
+            try:
+                result = handler(payload)
+            except Exception as e:
+                logger.exception("Job {} failed".format(job_id))
+                connection.send(('error', job_id, "{}: {}".format(type(e).__name__, e)))
+                continue
+            connection.send(('result', job_id, result))
+    except EOFError:
+        logger.info("Coordinator closed the connection")
+    finally:
+        connection.close()
@@ -0,0 +1,171 @@
+#!/bin/env python3
+"""Table extraction from the reference manual with an on-disk page cache
+
+The lattice flavor of camelot renders every page with ghostscript and runs
+the line and joint detection on the rendered image. Both steps only depend
+on the page content, the render resolution and the line detection
+parameters, so they are cached on disk. Parameters that only influence the
+text assignment (e.g. copy_text) reuse the cached geometry as is.
+"""
+
+import hashlib
+import itertools
+import logging
+import time
+
+from camelot.core import TableList
+from camelot.parsers import Lattice, Stream
+
+import progress
+from rm_table import RmTable
+
+logger = logging.getLogger(__name__)
+
+# Lattice parameters that change the detected lines and joints
+GEOMETRY_PARAMETERS = ('resolution', 'process_background', 'line_scale', 'threshold_blocksize',
+                       'threshold_constant', 'iterations', 'table_regions', 'table_areas')
+
+
+class CachedLattice(Lattice):
+    """Lattice parser that takes the rendered page and the line geometry from a PageCache"""
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.page_key = None
+        self.geometry = None
+        self.page_lock = None
+
+    def extract_tables(self, filename, *args, **kwargs):
+        try:
+            return super().extract_tables(filename, *args, **kwargs)
+        finally:
+            self._release_page_lock()
+
+    def _release_page_lock(self):
+        if self.page_lock is not None:
+            self.page_lock.release()
+            self.page_lock = None
+
+    def _geometry_parameters(self):
+        return tuple((p, repr(getattr(self, p, None))) for p in GEOMETRY_PARAMETERS)
+
+    def _resolution(self):
+        return getattr(self, 'resolution', 300)
+
+    def _generate_image(self):
+        with open(self.filename, 'rb') as f:
+            self.page_key = hashlib.sha1(f.read()).hexdigest()
+        self.geometry = self.cache.load_geometry(self.page_key, self._geometry_parameters())
+        if self.geometry is None:
+            # hold the lock of the page until its geometry is saved, so concurrent
+            # runs wait for the result instead of rendering the page as well
+            self.page_lock = self.cache.lock(self.cache.geometry_name(self.page_key, self._geometry_parameters()))
+            self.page_lock.acquire()
+            self.geometry = self.cache.load_geometry(self.page_key, self._geometry_parameters())
+        if self.geometry is not None:
+            # no need to render the page at all
+            progress.count('geometry_cache_hits')
+            self._release_page_lock()
+            return
+        self.imagename = "".join([self.rootname, ".png"])
+        if self.cache.load_image(self.page_key, self._resolution(), self.imagename):
+            progress.count('image_cache_hits')
+            return
+        progress.count('cache_misses')
+        super()._generate_image()
+        self.cache.save_image(self.page_key, self._resolution(), self.imagename)
+
+    def _generate_table_bbox(self):
+        if self.geometry is None:
+            super()._generate_table_bbox()
+            self.geometry = {'table_bbox': self.table_bbox,
+                             'table_bbox_unscaled': self.table_bbox_unscaled,
+                             'vertical_segments': self.vertical_segments,
+                             'horizontal_segments': self.horizontal_segments}
+            self.cache.save_geometry(self.page_key, self._geometry_parameters(), self.geometry)
+            self._release_page_lock()
+            return
+        for name, value in self.geometry.items():
+            setattr(self, name, value)
+        # the image is only needed for plotting
+        self.image = None
+
+
+def read_pdf(document, pages, cache=None, flavor='lattice', **kwargs):
+    """Extract the tables of the given page range
+
+    Works like camelot.read_pdf, but takes the single page files from the document
+    instead of splitting the pdf again and uses the CachedLattice parser if a cache
+    is given.
+    """
+    if flavor == 'lattice':
+        parser = CachedLattice(cache, **kwargs) if cache is not None else Lattice(**kwargs)
+    else:
+        parser = Stream(**kwargs)
+
+    tables = []
+    for page in range(pages[0], pages[-1] + 1):
+        progress.page_started(page)
+        tables.extend(parser.extract_tables(document.page_filename(page)))
+    progress.count('tables', len(tables))
+    return TableList(sorted(tables))
+
+
+def read_register_tables(document, pages, cache=None):
+    """Extract the register tables of the given page range
+
+    Pages with tables matching the register table templates are read from the text
+    layer and the vector rulings, only the other pages are extracted with camelot.
+    """
+    from ruled_table import read_ruled_tables
+
+    page_numbers = list(range(pages[0], pages[-1] + 1))
+    ruled_tables = read_ruled_tables(document, page_numbers)
+    progress.count('template_pages', len(ruled_tables))
+    tables = []
+    for page in page_numbers:
+        if page in ruled_tables:
+            progress.count('tables', len(ruled_tables[page]))
+            tables.extend(ruled_tables[page])
+        else:
+            tables.extend(read_pdf(document, [page, page], cache))
+    logger.debug("{} of {} pages extracted with templates".format(len(ruled_tables), len(page_numbers)))
+    return tables
+
+
+def _count_bit_overviews(tables):
+    return len([t for t in tables if RmTable(t).is_bit_overview()])
+
+
+def default_sweep_parameters():
+    parameter_sets = []
+    for line_scale, process_background, copy_text in itertools.product(
+            (15, 40, 60), (False, True), (None, ['v'])):
+        parameter_sets.append({'line_scale': line_scale,
+                               'process_background': process_background,
+                               'copy_text': copy_text})
+    return parameter_sets
+
+
+def sweep(document, pages, cache, parameter_sets=None):
+    """Extract the pages with every parameter set and count the valid bit overview tables
+
+    Returns a list of (parameters, number of tables, number of bit overviews, duration),
+    sorted with the best parameter set first.
+    """
+    if parameter_sets is None:
+        parameter_sets = default_sweep_parameters()
+
+    results = []
+    for parameters in parameter_sets:
+        start = time.perf_counter()
+        tables = read_pdf(document, pages, cache, **parameters)
+        duration = time.perf_counter() - start
+        overviews = _count_bit_overviews(tables)
+        logger.info("Parameters {}: {} tables, {} bit overviews, {:.1f}s".format(
+            parameters, len(tables), overviews, duration))
+        results.append((parameters, len(tables), overviews, duration))
+
+    results.sort(key=lambda r: (-r[2], r[3]))
+    return results
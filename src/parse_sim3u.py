@@ -3,45 +3,79 @@
 
 """
 
-import camelot
-import pandas
+# camelot (via extractor) and pandas are imported inside the extraction functions only:
+# camelot pulls in opencv, pdfminer and matplotlib, which is several seconds
+# of startup that the cached model path does not need.
+import os
 import pickle
 import re
 import sys
+import threading
 import argparse
+import functools
 import logging
 from register import Register, RegisterBits, RegisterBitTableEntry, RegisterBitTableEntryCollection
-from peripheral import Peripheral
+from peripheral import Interrupt, Peripheral
 from rm_table import RmTable
 from pdf_doc import Document, Manual
 from svd import SvdGenerator
+from validator import SvdValidator
+from patch import apply_patch_files
+import svd_diff
+from scheduler import Stage, StageAborted, StageScheduler
+from progress import Progress
+from supervisor import SupervisedExecutor
+from shared_cache import PageCache, SharedCache, file_digest, is_cache_entry
+from device_binary import write_device_description
+from atomic_file import atomic_write
+import progress
+from distributed import Coordinator, JobError, generate_authkey, is_loopback, parse_address, run_worker
 
 logger = logging.getLogger(__name__)
 
 
-def parse_peripheral_overview(pdf_filename, page_list):
-    pages = "{}-{}".format(page_list[0], page_list[1])
-    reg_overview_tables = camelot.read_pdf(pdf_filename, pages=pages)
+def read_peripheral_overview_rows(document, page_list, cache=None):
+    """Return the rows of the register memory map tables as lists of strings"""
+    import pandas
+    from extractor import read_pdf
+
+    reg_overview_tables = read_pdf(document, page_list, cache)
+    if not reg_overview_tables:
+        return []
 
     # flatten dfs
     dfs = [x.df for x in reg_overview_tables]
-    table = pandas.concat(dfs)
+    table = pandas.concat(dfs).fillna('')
+    return [list(content) for content in table.values.tolist()]
 
-    peripherals = dict()
-    current_peripheral = None
-    # get all peripheral names
-    for row in table.iterrows():
-        content = row[1]
+
+class PeripheralOverviewBuilder:
+    """Creates the peripherals and their registers from the rows of the memory map
+
+    on_peripheral is called with every peripheral as soon as all of its registers are known.
+    """
+
+    def __init__(self, on_peripheral=None):
+        self.peripherals = dict()
+        self.current_peripheral = None
+        self.on_peripheral = on_peripheral
+
+    def _complete_current_peripheral(self):
+        if self.current_peripheral is not None and self.on_peripheral:
+            self.on_peripheral(self.current_peripheral)
+
+    def add_row(self, content):
         if 'Register Name' in content[0]:
-            continue
+            return
         if ' Registers' in content[0]:
             name = content[0].replace(' Registers', '')
             logger.debug("New Peripheral {}".format(name))
-            current_peripheral = Peripheral(name)
-            peripherals[name] = current_peripheral
-            continue
-        if current_peripheral is None:
-            continue
+            self._complete_current_peripheral()
+            self.current_peripheral = Peripheral(name)
+            self.peripherals[name] = self.current_peripheral
+            return
+        if self.current_peripheral is None:
+            return
 
         logger.debug("New Register {}".format(content[0]))
         logger.debug(content)
@@ -69,24 +103,28 @@ def parse_peripheral_overview(pdf_filename, page_list):
             has_msk = 'Y' in content[5]
 
         # remove peripheral name from register name
-        name = name.replace(current_peripheral.name + '_', '')
+        name = name.replace(self.current_peripheral.name + '_', '')
         reg = Register(name, title, int(addr.replace('_', ''), 0), has_set, has_clr, has_msk)
-        current_peripheral.add_register(reg)
-        # peripherals[current_peripheral.name] = current_peripheral
-    return peripherals
+        self.current_peripheral.add_register(reg)
 
+    def finish(self):
+        self._complete_current_peripheral()
+        self.current_peripheral = None
+        return self.peripherals
 
-class Interrupt:
-    def __init__(self, content):
-        self.index = int(content[0])
-        self.name = content[2].replace(' ', '_')
-        self.description = content[3]
-        self.address = int(content[4], 0)
 
+def parse_peripheral_overview(document, page_list, cache=None):
+    builder = PeripheralOverviewBuilder()
+    for content in read_peripheral_overview_rows(document, page_list, cache):
+        builder.add_row(content)
+    return builder.finish()
 
-def parse_interrupts(pdf_filename, page_list):
-    pages = "{}-{}".format(page_list[0], page_list[1])
-    interrupts_tables = camelot.read_pdf(pdf_filename, pages=pages)
+
+def parse_interrupts(document, page_list, cache=None):
+    import pandas
+    from extractor import read_pdf
+
+    interrupts_tables = read_pdf(document, page_list, cache)
 
     # flatten dfs
     dfs = [x.df for x in interrupts_tables]
@@ -126,29 +164,27 @@ map_int_prefix_to_periph = {'DMA': 'DMACTRL0',
                             }
 
 
-def attach_interrupts_to_peripherals(peripherals, interrupts):
-    for i in interrupts:
-        logger.debug("Processing Interrupt {}".format(i.name))
-        if i.name in peripherals:
-            peripherals[i.name].add_interrupt(i)
-            continue
+def _interrupt_peripheral(interrupt):
+    for prefix, periph in map_int_prefix_to_periph.items():
+        if interrupt.name.startswith(prefix):
+            return periph
+    return map_int_to_periph.get(interrupt.name, interrupt.name)
 
-        found = False
-        for prefix, periph in map_int_prefix_to_periph.items():
-            if i.name.startswith(prefix):
-                peripherals[periph].add_interrupt(i)
-                found = True
-                break
-        if found:
-            continue
 
-        try:
-            peripheral_name = map_int_to_periph[i.name]
-            peripherals[peripheral_name].add_interrupt(i)
-            continue
-        except:
-            logger.error("No periph found for Interrupt {}".format(i.name))
-            raise
+def assign_interrupts(interrupts, peripheral_names):
+    """Return the (peripheral name, interrupt) pairs and the interrupts without a peripheral"""
+    if isinstance(interrupts, StageAborted):
+        return [], []
+    assignments = []
+    unassigned = []
+    for i in interrupts:
+        logger.debug("Processing Interrupt {}".format(i.name))
+        name = i.name if i.name in peripheral_names else _interrupt_peripheral(i)
+        if name in peripheral_names:
+            assignments.append((name, i))
+        else:
+            unassigned.append(i)
+    return assignments, unassigned
 
 
 map_derived_periph = {'PBSTD0': 'PBSTD2',
@@ -264,29 +300,368 @@ def parse_reg_bit_overview(peripheral, df):
     return register
 
 
-def parse_peripheral_register(pdf_filename, peripheral, pages):
-    tables = camelot.read_pdf(
-        pdf_filename, pages="{}-{}".format(pages[0], pages[1]))
+# alternate extractor settings to retry a page with, if a table could not be parsed,
+# tables read from the rulings of the page are retried with the default settings first
+retry_settings = [{'line_scale': 40},
+                  {'line_scale': 40, 'process_background': True},
+                  {'flavor': 'stream'},
+                  ]
+
+
+class ExtractionFailure:
+    def __init__(self, peripheral, pages, error, register=None):
+        self.peripheral = peripheral
+        self.pages = pages
+        self.error = error
+        self.register = register
+
+    def __str__(self):
+        peripheral = self.peripheral.name if self.peripheral else "?"
+        register = self.register.name if self.register else "?"
+        return "Peripheral {} register {} pg. {}: {}".format(
+            peripheral, register, self.pages, self.error)
+
+
+def _determine_register_or_none(peripheral, df):
+    try:
+        return determine_register(peripheral, df)
+    except Exception:
+        return None
+
+
+def _retry_reg_bit_overview(document, peripheral, page, register, cache, table):
+    from extractor import read_pdf
+    from ruled_table import RuledTable
+
+    # a table of camelot was already extracted with the default settings
+    settings_list = ([{}] if isinstance(table, RuledTable) else []) + retry_settings
+    for settings in settings_list:
+        logger.info("Retrying pg. {} with {}".format(page, settings))
+        progress.count('retries')
+        try:
+            tables = read_pdf(document, [page, page], cache, **settings)
+        except Exception as e:
+            logger.warning("Extraction of pg. {} with {} failed: {}".format(page, settings, e))
+            continue
+        for t in tables:
+            if not RmTable(t).is_bit_overview():
+                continue
+            table_register = _determine_register_or_none(peripheral, t.df)
+            if table_register is None:
+                continue
+            if register is not None and table_register is not register:
+                continue
+            if register is None and table_register.bits is not None:
+                # do not touch registers that were already parsed successfully
+                continue
+            try:
+                register = parse_reg_bit_overview(peripheral, t.df)
+                register.page = page
+                return register
+            except Exception as e:
+                logger.debug("Retry of pg. {} with {} failed: {}".format(page, settings, e))
+    return None
+
+
+def _parse_reg_bit_overview_isolated(document, peripheral, table, cache, failures):
+    page = int(table.page)
+    try:
+        register = parse_reg_bit_overview(peripheral, table.df)
+        if register:
+            register.page = page
+        return register
+    except Exception as e:
+        error = e
+
+    register = _determine_register_or_none(peripheral, table.df)
+    logger.warning("Parsing bit overview on pg. {} failed: {}".format(page, error))
+    retried_register = _retry_reg_bit_overview(document, peripheral, page, register, cache, table)
+    if retried_register is not None:
+        logger.info("Retry of pg. {} succeeded for register {}".format(page, retried_register.name))
+        return retried_register
+
+    # the register stays in the model, but without fields
+    progress.count('failures')
+    failures.append(ExtractionFailure(peripheral, [page, page], error, register))
+    return None
+
+
+def _parse_reg_bit_description_isolated(register, descriptions, pages, failures):
+    import pandas
+
+    description_df = pandas.concat(descriptions, ignore_index=True)
+    try:
+        parse_reg_bit_description(register, description_df)
+    except Exception as e:
+        logger.warning("Parsing bit description of register {} failed: {}".format(register.name, e))
+        progress.count('failures')
+        failures.append(ExtractionFailure(register.peripheral, [min(pages), max(pages)], e, register))
+
+
+def parse_peripheral_register(document, peripheral, pages, cache=None, failures=None):
+    """Parse the register tables of a peripheral
+
+    Each register is parsed on its own, a table that cannot be parsed is added to the
+    failures list instead of aborting the whole run.
+    """
+    from extractor import read_register_tables
+
+    if failures is None:
+        failures = []
+
+    try:
+        tables = read_register_tables(document, pages, cache)
+    except Exception as e:
+        logger.warning("Extraction of peripheral {} failed: {}".format(peripheral.name, e))
+        progress.count('failures')
+        failures.append(ExtractionFailure(peripheral, pages, e))
+        return failures
 
     # tables[0] is the overview with reset values RW/R etc
 
     descriptions = []
+    description_pages = []
     register = None
     for t in tables:
         rm_table = RmTable(t)
         if rm_table.is_bit_overview():
             if descriptions and register:
-                description_df = pandas.concat(descriptions, ignore_index=True)
-                parse_reg_bit_description(register, description_df)
-            register = parse_reg_bit_overview(peripheral, t.df)
+                _parse_reg_bit_description_isolated(register, descriptions, description_pages, failures)
+            register = _parse_reg_bit_overview_isolated(document, peripheral, t, cache, failures)
             descriptions = []
+            description_pages = []
             continue
         if rm_table.is_bit_description():
             descriptions.append(t.df)
+            description_pages.append(int(t.page))
 
     if descriptions and register:
-        description_df = pandas.concat(descriptions, ignore_index=True)
-        parse_reg_bit_description(register, description_df)
+        _parse_reg_bit_description_isolated(register, descriptions, description_pages, failures)
+
+    return failures
+
+
+def _page_count(pages):
+    return pages[-1] - pages[0] + 1 if pages else 0
+
+
+def _parse_peripheral_register_stage(document, pages, cache, peripheral):
+    failures = parse_peripheral_register(document, peripheral, pages, cache)
+    return peripheral, failures
+
+
+class RegisterJobHandler:
+    """Executes the register extraction jobs of a coordinator in a worker
+
+    pdf_filename replaces the filename of the job, if the manual is stored at a
+    different location on the worker node. The worker opens its own document
+    session, page files are not shared between nodes.
+    """
+
+    def __init__(self, pdf_filename=None, cache=None):
+        self.pdf_filename = pdf_filename
+        self.cache = cache
+        self.documents = dict()
+
+    def _document(self, pdf_filename):
+        pdf_filename = self.pdf_filename or pdf_filename
+        if pdf_filename not in self.documents:
+            self.documents[pdf_filename] = Document(pdf_filename)
+        return self.documents[pdf_filename]
+
+    def close(self):
+        for document in self.documents.values():
+            document.close()
+
+    def __call__(self, payload):
+        """Return the result of the stage, its duration and its counters"""
+        pdf_filename, peripheral, pages = payload
+        logger.info("Parsing registers for peripheral {} pg. {}".format(peripheral.name, pages))
+        return progress.run_counted(_parse_peripheral_register_stage,
+                                    (self._document(pdf_filename), pages, self.cache, peripheral))
+
+
+def _merge_registers(peripheral, parsed):
+    """Take the registers with fields from parsed, a copy of peripheral that a stage returned"""
+    if parsed is peripheral:
+        return
+    for name, register in parsed.registers.items():
+        if register.bits is not None:
+            register.peripheral = peripheral
+            peripheral.registers[name] = register
+
+
+class ExtractionPipeline:
+    """Extracts the peripherals from the manual with a StageScheduler
+
+    The memory map is extracted page by page, the interrupt table independently of it.
+    The register stage of a peripheral has the peripheral as input, which is provided
+    as soon as the memory map pages containing it are done. The interrupts are assigned
+    as soon as the interrupt table and the names of all peripherals (provided with the
+    last memory map page) are known. With a coordinator the register extraction is handed
+    out to its workers instead of running in the local stages. Stages aborted by
+    a supervisor.SupervisedExecutor are reported as failures.
+    """
+
+    def __init__(self, document, manual, cache=None, jobs=1, coordinator=None, metrics_filename=None,
+                 executor=None):
+        self.document = document
+        self.manual = manual
+        self.cache = cache
+        self.coordinator = coordinator
+        self.register_jobs = dict()
+        # register stages by peripheral name, more than one after a stage was aborted on a page
+        self.register_stages = dict()
+        self.stage_pages = dict()
+        # memory map pages that could not be read
+        self.overview_failures = []
+        self.scheduler = StageScheduler(jobs, self._stage_done, executor)
+        self.builder = PeripheralOverviewBuilder(self._add_register_stage)
+        pages = manual.get_chapter_pages('3. SiM3U1xx/SiM3C1xx Register Memory Map')
+        self.overview_pages = list(range(pages[0], pages[-1] + 1))
+        self.interrupt_pages = manual.get_chapter_pages('4.2. Interrupt Vector Table')
+        self.next_overview_page = 0
+        # until the overview is parsed, estimate the pages from the register chapters of the outline
+        register_pages = sum(_page_count(c.page) for c in manual.get_register_chapters())
+        self.progress = Progress(len(self.overview_pages) + _page_count(self.interrupt_pages) + register_pages,
+                                 metrics_filename)
+        # results of the coordinator are reported from its threads
+        self.progress_lock = threading.Lock()
+
+    def _stage_done(self, stage, duration, counters):
+        kind = stage.name.split('_')[0]
+        with self.progress_lock:
+            self.progress.stage_done(kind, self.stage_pages.get(stage.name, 0), duration, counters)
+
+    def _register_job_done(self, stage_name, result):
+        if isinstance(result, JobError):
+            return
+        result, duration, counters = result
+        with self.progress_lock:
+            self.progress.stage_done('registers', self.stage_pages[stage_name], duration, counters)
+
+    def _add_register_stage(self, peripheral):
+        if peripheral.name in map_derived_periph:
+            # skip peripherals that are derived from others
+            return
+        pages = self.manual.get_pages_for_registers(peripheral.name)
+        peripheral.pages = pages
+        if not pages:
+            logger.warning("Peripheral {} register description not found".format(peripheral.name))
+            return
+        logger.info("Parsing registers for peripheral {} pg. {}".format(peripheral.name, pages))
+        stage_name = "registers_{}".format(peripheral.name)
+        self.stage_pages[stage_name] = _page_count(pages)
+        if self.coordinator:
+            job_id = self.coordinator.submit((self.document.filename, peripheral, pages),
+                                             functools.partial(self._register_job_done, stage_name))
+            self.register_jobs[job_id] = stage_name
+            return
+        self.document.split_pages(pages)
+        self._add_register_pages_stage(peripheral.name, stage_name, pages)
+        self.scheduler.provide("peripheral_{}".format(peripheral.name), peripheral)
+
+    def _add_register_pages_stage(self, name, stage_name, pages):
+        self.register_stages.setdefault(name, []).append(stage_name)
+        self.scheduler.add_stage(Stage(stage_name, _parse_peripheral_register_stage,
+                                       args=(self.document, pages, self.cache),
+                                       inputs=("peripheral_{}".format(name),),
+                                       on_done=functools.partial(self._register_stage_done, name, pages)))
+
+    def _register_stage_done(self, name, pages, scheduler, stage, values):
+        """Parse the pages before and after the page that aborted the stage again, in a fresh worker"""
+        page = getattr(values[0], 'page', None)
+        if not isinstance(values[0], StageAborted) or page is None:
+            return
+        for first, last in ((pages[0], page - 1), (page + 1, pages[-1])):
+            if first <= last:
+                logger.info("Parsing registers for peripheral {} pg. {} again".format(name, [first, last]))
+                self._add_register_pages_stage(name, "rerun_registers_{}_{}-{}".format(name, first, last),
+                                               [first, last])
+
+    def _overview_page_done(self, scheduler, stage, values):
+        # the rows must be processed in page order, a peripheral can span several pages
+        while self.next_overview_page < len(self.overview_pages):
+            name = "overview_{}".format(self.overview_pages[self.next_overview_page])
+            if name not in scheduler.results:
+                return
+            rows = scheduler.results[name]
+            if isinstance(rows, StageAborted):
+                logger.error("Memory map page skipped: {}".format(rows))
+                page = self.overview_pages[self.next_overview_page]
+                self.overview_failures.append(ExtractionFailure(None, [page, page], rows))
+                rows = []
+            for content in rows:
+                self.builder.add_row(content)
+            self.next_overview_page += 1
+        self.builder.finish()
+        scheduler.provide('peripheral_names', sorted(self.builder.peripherals))
+        logger.info("Done parsing peripheral overview")
+        # now the pages of all stages are known
+        with self.progress_lock:
+            self.progress.set_total_pages(sum(self.stage_pages.values()))
+            self.progress.set_total_peripherals(len([n for n in self.stage_pages if n.startswith('registers_')]))
+
+    def run(self):
+        self.document.split_pages(self.overview_pages)
+        self.document.split_pages(self.interrupt_pages)
+        self.stage_pages['interrupts'] = _page_count(self.interrupt_pages)
+        for page in self.overview_pages:
+            self.stage_pages["overview_{}".format(page)] = 1
+            self.scheduler.add_stage(Stage("overview_{}".format(page), read_peripheral_overview_rows,
+                                           args=(self.document, [page, page], self.cache),
+                                           on_done=self._overview_page_done))
+        self.scheduler.add_stage(Stage("interrupts", parse_interrupts,
+                                       args=(self.document, self.interrupt_pages, self.cache)))
+        self.scheduler.add_stage(Stage("interrupt_assignment", assign_interrupts,
+                                       inputs=('interrupts', 'peripheral_names')))
+        results = self.scheduler.run()
+
+        peripherals = self.builder.peripherals
+        register_results = dict()
+        for name, stage_names in self.register_stages.items():
+            register_results[name] = [results[s] for s in stage_names]
+        if self.coordinator:
+            for job_id, result in self.coordinator.wait().items():
+                if job_id not in self.register_jobs:
+                    continue
+                stage_name = self.register_jobs[job_id]
+                name = stage_name[len('registers_'):]
+                # the progress of the job was reported by _register_job_done()
+                register_results[name] = [result if isinstance(result, JobError) else result[0]]
+
+        failures = list(self.overview_failures)
+        for name, stage_results in register_results.items():
+            for result in stage_results:
+                if isinstance(result, JobError):
+                    failures.append(ExtractionFailure(peripherals[name], peripherals[name].pages, result))
+                    continue
+                if isinstance(result, StageAborted):
+                    page = getattr(result, 'page', None)
+                    pages = [page, page] if page is not None else peripherals[name].pages
+                    failures.append(ExtractionFailure(peripherals[name], pages, result))
+                    continue
+                peripheral, peripheral_failures = result
+                if len(stage_results) == 1:
+                    peripherals[name] = peripheral
+                else:
+                    _merge_registers(peripherals[name], peripheral)
+                failures.extend(peripheral_failures)
+        logger.info("Done parsing registers for peripherals")
+        self.progress.report()
+
+        if isinstance(results['interrupts'], StageAborted):
+            logger.error("Interrupts are missing: {}".format(results['interrupts']))
+        assignments, unassigned = results['interrupt_assignment']
+        for name, i in assignments:
+            peripherals[name].add_interrupt(i)
+        for i in unassigned:
+            # e.g. the peripheral was on a memory map page that could not be read
+            logger.error("No periph found for Interrupt {}".format(i.name))
+            error = "Interrupt {} has no peripheral {}".format(i.name, _interrupt_peripheral(i))
+            failures.append(ExtractionFailure(None, self.interrupt_pages, error))
+        populate_derived_from_info(peripherals)
+        return peripherals, failures
 
 
 class Persistency:
@@ -299,12 +674,36 @@ class Persistency:
                 return pickle.load(f)
         except IOError:
             return None
+        except (pickle.UnpicklingError, EOFError) as e:
+            logger.warning("Ignoring damaged model {}: {}".format(self.filename, e))
+            return None
 
     def save(self, data):
-        with open(self.filename, 'wb') as f:
+        # a concurrent run never reads a partial file
+        with atomic_write(self.filename) as f:
             pickle.dump(data, f)
 
 
+def load_svd_index(filename):
+    """Load the path index of a svd file or of the svd generated from a cached model"""
+    if filename.endswith('.pickle'):
+        if is_cache_entry(filename):
+            directory, name = os.path.split(filename)
+            peripherals = SharedCache(directory or '.').load(name)
+        else:
+            peripherals = Persistency(filename).load()
+        if peripherals is None:
+            raise Exception("Cannot load cached model {}".format(filename))
+        return svd_diff.index_svd(SvdGenerator(peripherals).build().getroot())
+    return svd_diff.load_svd_index(filename)
+
+
+def diff_svd(old_filename, new_filename):
+    diff = svd_diff.SvdDiff(load_svd_index(old_filename), load_svd_index(new_filename))
+    print(diff)
+    return 1 if diff else 0
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -316,9 +715,100 @@ def parse_args():
     parser.add_argument("--out", default=None,
                         help="Filename of the svd file to generate")
 
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory to cache rendered pages and detected table lines in")
+
+    parser.add_argument("--sweep", default=None, metavar="FIRST-LAST",
+                        help="Only try different extractor settings on the given pages "
+                             "and report which ones find the bit overview tables")
+
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of processes to extract independent tables concurrently")
+
+    parser.add_argument("--listen", default=None, metavar="HOST:PORT",
+                        help="Hand out the register extraction to workers connecting to this address")
+
+    parser.add_argument("--local-workers", type=int, default=0,
+                        help="Number of workers to start on this host when listening for workers")
+
+    parser.add_argument("--page-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Extract in supervised worker processes and restart a worker that needs longer "
+                             "for a page")
+
+    parser.add_argument("--max-rss", type=int, default=None, metavar="MB",
+                        help="Extract in supervised worker processes and restart a worker whose memory "
+                             "(including child processes) exceeds the limit")
+
+    parser.add_argument("--worker", default=None, metavar="HOST:PORT",
+                        help="Run as worker for the coordinator at the given address")
+
+    parser.add_argument("--from-svd", default=None, metavar="SVD",
+                        help="Load the model from an existing svd file instead of the manual or the cache")
+
+    parser.add_argument("--diff", nargs=2, default=None, metavar=("OLD", "NEW"),
+                        help="Compare two svd files, sharded svd directories or cached models (*.pickle, also "
+                             "the ones in the cache directory) and report the differences")
+
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="Write progress and extraction metrics in the Prometheus textfile format")
+
+    parser.add_argument("--shards", default=None, metavar="DIR",
+                        help="Write one svd file per peripheral and the index device.svd into DIR, "
+                             "using --jobs processes")
+
+    parser.add_argument("--binary", default=None, metavar="FILE",
+                        help="Write the binary device description for device_binary.DeviceDescription into FILE")
+
+    parser.add_argument("--no-dim-arrays", action="store_true",
+                        help="Write repeated registers as single elements instead of dim arrays")
+
+    parser.add_argument("--patch", action="append", default=[], metavar="FILE",
+                        help="Apply the patches of the json file to the model before generating the svd file, "
+                             "can be given multiple times")
+
+    parser.add_argument("--strict", action="store_true",
+                        help="Do not generate the svd file if the validation of the model finds problems")
+
     return parser.parse_args()
 
 
+def extract_model(pdf_filename, args, cache, authkey):
+    """Parse the peripherals from the manual"""
+    # get the chapters and pages from the pdf
+    with Document(pdf_filename) as document:
+        logger.info("Parsing toc of document {}".format(pdf_filename))
+        manual = document.parse_toc()
+        logger.info("Done parsing toc")
+        logger.debug(manual)
+
+        coordinator = None
+        executor = None
+        try:
+            if args.listen:
+                coordinator = Coordinator(parse_address(args.listen), authkey)
+                coordinator.start()
+                coordinator.start_local_workers(args.local_workers, RegisterJobHandler(cache=cache))
+
+            if args.page_timeout or args.max_rss:
+                rss_limit = args.max_rss * 1024 * 1024 if args.max_rss else None
+                executor = SupervisedExecutor(args.jobs, args.page_timeout, rss_limit)
+
+            logger.info("Parsing peripherals from document {}".format(pdf_filename))
+            pipeline = ExtractionPipeline(document, manual, cache, args.jobs, coordinator, args.metrics, executor)
+            peripherals, failures = pipeline.run()
+        finally:
+            # after a failure of the pipeline, do not wait for the jobs that are still queued
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            if coordinator:
+                coordinator.close()
+    if failures:
+        logger.warning("{} tables could not be parsed, these registers have no fields:".format(len(failures)))
+        for f in failures:
+            logger.warning("  {}".format(f))
+    return peripherals
+
+
 def main():
     args = parse_args()
     pdf_filename = args.input
@@ -326,57 +816,87 @@ def main():
 
     # setup the logger
     handler = logging.StreamHandler(sys.stdout)
-    logger.setLevel(logging.INFO)
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
-
-    # get the chapters and pages from the pdf
-    doc = Document(pdf_filename)
-    logger.info("Parsing toc of document".format(pdf_filename))
-    manual = doc.parse_toc()
-    logger.info("Done parsing toc")
-    logger.debug(manual)
+    for name in (__name__, 'extractor', 'ruled_table', 'scheduler', 'distributed', 'progress', 'patch',
+                 'svd_shards', 'supervisor', 'shared_cache', 'device_binary'):
+        logging.getLogger(name).setLevel(logging.INFO)
+        logging.getLogger(name).addHandler(handler)
+
+    cache = None
+    if args.cache_dir:
+        cache = PageCache(args.cache_dir)
+
+    # shared key of coordinator and workers
+    authkey = os.environ.get('SIM3U_SVD_AUTHKEY', '').encode() or None
+    if authkey is None and args.worker:
+        logger.error("--worker needs the key of the coordinator in SIM3U_SVD_AUTHKEY")
+        sys.exit(1)
+    if authkey is None and args.listen:
+        if not args.local_workers or not is_loopback(parse_address(args.listen)[0]):
+            logger.error("--listen needs a key in SIM3U_SVD_AUTHKEY, without one only --local-workers "
+                         "on a loopback address are possible")
+            sys.exit(1)
+        # only the local workers started by this process need to know it
+        authkey = generate_authkey()
+
+    if args.worker:
+        logger.info("Working for coordinator {}".format(args.worker))
+        handler = RegisterJobHandler(pdf_filename, cache)
+        run_worker(parse_address(args.worker), handler, authkey)
+        handler.close()
+        return
+
+    if args.diff:
+        sys.exit(diff_svd(*args.diff))
+
+    if args.sweep:
+        from extractor import sweep
+        if cache is None:
+            cache = PageCache('.page_cache')
+        pages = [int(x) for x in args.sweep.split('-')]
+        if len(pages) == 1:
+            pages.append(pages[0])
+        logger.info("Sweeping extractor settings on pg. {}".format(pages))
+        with Document(pdf_filename) as document:
+            results = sweep(document, pages, cache)
+        best = results[0]
+        logger.info("Best settings {}: {} of {} tables are bit overviews".format(best[0], best[2], best[1]))
+        return
 
     persistency = Persistency('data.pickle')
-    peripherals = persistency.load()
-
-    if peripherals is None:
-        logger.info(
-            "Parsing peripheral overview from document {}".format(pdf_filename))
-        peripherals = parse_peripheral_overview(pdf_filename, manual.get_chapter_pages(
-            '3. SiM3U1xx/SiM3C1xx Register Memory Map'))
-        logger.info("Done parsing peripheral overview")
-
-        logger.info("Parsing interrupts from document {}".format(pdf_filename))
-        pages = manual.get_chapter_pages('4.2. Interrupt Vector Table')
-        interrupts = parse_interrupts(pdf_filename, pages)
-
-        attach_interrupts_to_peripherals(peripherals, interrupts)
-
-        populate_derived_from_info(peripherals)
-
-        for p_n, p in peripherals.items():
-            if p.derived_from:
-                # skip peripherals that are derived from others
-                continue
-            pages = manual.get_pages_for_registers(p.name)
-            logger.info("Peripheral {} pg. {}".format(p.name, pages))
-            if pages:
-                logger.info("Parsing registers for peripheral {}".format(p.name))
-                parse_peripheral_register(pdf_filename, p, pages)
-            else:
-                logger.warning(
-                    "Peripheral {} register description not found".format(p.name))
-                # for n, r in p.registers.items():
-                #    print("\tRegister {}".format(n))
-                #    print(r)
-        logger.info("Done parsing registers for peripherals")
-        persistency.save(peripherals)
-
-    svd = SvdGenerator(peripherals)
-    svd.generate(svd_filename)
+    if args.from_svd:
+        from svd_loader import load_svd
+        logger.info("Loading model from {}".format(args.from_svd))
+        peripherals = load_svd(args.from_svd)
+    elif cache is not None and pdf_filename:
+        # shared by concurrent runs with the same cache directory, only one of them parses the manual
+        model_name = "model-{}.pickle".format(file_digest(pdf_filename))
+        peripherals = cache.get_or_create(model_name, lambda: extract_model(pdf_filename, args, cache, authkey))
+    else:
+        peripherals = persistency.load()
+        if peripherals is None:
+            peripherals = extract_model(pdf_filename, args, cache, authkey)
+            persistency.save(peripherals)
+
+    if args.patch:
+        apply_patch_files(peripherals, args.patch)
+
+    problems = SvdValidator(peripherals).validate()
+    for problem in problems:
+        logger.warning("Validation: {}".format(problem))
+    if problems and args.strict:
+        logger.error("{} validation problems found, not generating svd file".format(len(problems)))
+        sys.exit(1)
+
+    svd = SvdGenerator(peripherals, dim_arrays=not args.no_dim_arrays)
+    if args.shards:
+        svd.generate_shards(args.shards, args.jobs)
+    if svd_filename or not (args.shards or args.binary):
+        svd.generate(svd_filename)
+    if args.binary:
+        write_device_description(peripherals, args.binary)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+#!/bin/env python3
+"""Declarative patches of the peripheral model
+
+Fixes of bad extractions can be written into a json file instead of the
+parser, they are applied to the cached model before the svd file is
+generated, so changing them does not require a new extraction. The file
+contains a list of patches, each with the path of the patched element and
+one or more operations:
+
+    [
+        {"path": "UART0/CONFIG/EN", "rename": "ENABLE"},
+        {"path": "UART0/CONFIG/EN", "enum_names": {"read-write": {"0b1": "On"}}},
+        {"path": "UART0/CONFIG/EN", "bit_offset": 4},
+        {"path": "UART0/CONFIG", "offset": "0x10"},
+        {"path": "UART0", "add_interrupt": {"name": "UART0", "index": 12}},
+        {"path": "UART1", "derived_from": "UART0"}
+    ]
+
+Paths are PERIPHERAL, PERIPHERAL/REGISTER or PERIPHERAL/REGISTER/FIELD. All
+elements of the model are indexed by path once, so every patch is applied in
+constant time.
+"""
+
+import json
+import logging
+
+from peripheral import Interrupt
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = {
+    1: ('rename', 'description', 'derived_from', 'add_interrupt'),
+    2: ('rename', 'description', 'address', 'offset'),
+    3: ('rename', 'enum_names', 'bit_offset'),
+}
+
+
+def _int(value):
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def load_patches(filename):
+    with open(filename) as f:
+        patches = json.load(f)
+    if not isinstance(patches, list):
+        raise Exception("Patch file {} must contain a list of patches".format(filename))
+    return patches
+
+
+class ModelPatcher:
+    def __init__(self, peripherals):
+        self.peripherals = peripherals
+        self.index = dict()
+        for p in peripherals.values():
+            self._index_peripheral(p)
+
+    def _index_peripheral(self, peripheral):
+        self.index[peripheral.name] = peripheral
+        for r in peripheral.registers.values():
+            self._index_register(peripheral.name, r)
+
+    def _index_register(self, path, register):
+        path = "{}/{}".format(path, register.name)
+        self.index[path] = register
+        if register.bits:
+            for entry in register.bits.entries:
+                if entry.name != 'Reserved':
+                    self.index["{}/{}".format(path, entry.name)] = entry
+
+    def _remove_from_index(self, path, element):
+        """Remove element and its children, without looking at the rest of the index"""
+        del self.index[path]
+        children = []
+        if path.count('/') == 0:
+            children = element.registers.values()
+        elif path.count('/') == 1 and element.bits:
+            children = element.bits.entries
+        for child in children:
+            child_path = "{}/{}".format(path, child.name)
+            if self.index.get(child_path) is child:
+                self._remove_from_index(child_path, child)
+
+    def _rename(self, path, element, name):
+        parent, _, _ = path.rpartition('/')
+        new_path = "{}/{}".format(parent, name) if parent else name
+        if new_path in self.index:
+            raise Exception("Cannot rename {}, {} already exists".format(path, new_path))
+        self._remove_from_index(path, element)
+        old_name = element.name
+        element.name = name
+        if path.count('/') == 0:
+            # keep the order of the peripherals
+            items = [(name if n == old_name else n, p) for n, p in self.peripherals.items()]
+            self.peripherals.clear()
+            self.peripherals.update(items)
+            for p in self.peripherals.values():
+                if p.derived_from == old_name:
+                    p.derived_from = name
+            self._index_peripheral(element)
+        elif path.count('/') == 1:
+            registers = element.peripheral.registers
+            items = [(name if n == old_name else n, r) for n, r in registers.items()]
+            registers.clear()
+            registers.update(items)
+            self._index_register(parent, element)
+        else:
+            self.index[new_path] = element
+
+    def _add_interrupt(self, peripheral, interrupt):
+        index = _int(interrupt['index'])
+        peripheral.add_interrupt(Interrupt.from_index(index, interrupt['name'], interrupt.get('description', '')))
+
+    def _set_address(self, register, address):
+        register.address = address
+
+    def _set_offset(self, register, offset):
+        base_address = min(r.address for r in register.peripheral.registers.values())
+        register.address = base_address + offset
+
+    def _set_bit_offset(self, entry, offset):
+        width = len(entry.bits)
+        entry.bits = list(range(offset + width - 1, offset - 1, -1))
+
+    def apply(self, patch):
+        path = patch.get('path', '')
+        element = self.index.get(path)
+        if element is None:
+            raise Exception("Patch {}: unknown path {}".format(patch, path))
+        depth = path.count('/') + 1
+        unknown = [k for k in patch if k != 'path' and k not in OPERATIONS[depth]]
+        if unknown:
+            raise Exception("Patch {}: operations {} are not supported for {}".format(patch, unknown, path))
+
+        logger.info("Patching {}".format(path))
+        if 'description' in patch:
+            element.description = patch['description']
+        if 'derived_from' in patch:
+            if patch['derived_from'] and patch['derived_from'] not in self.peripherals:
+                raise Exception("Patch {}: unknown peripheral {}".format(patch, patch['derived_from']))
+            element.derived_from = patch['derived_from']
+        if 'add_interrupt' in patch:
+            self._add_interrupt(element, patch['add_interrupt'])
+        if 'address' in patch:
+            self._set_address(element, _int(patch['address']))
+        if 'offset' in patch:
+            self._set_offset(element, _int(patch['offset']))
+        if 'bit_offset' in patch:
+            self._set_bit_offset(element, _int(patch['bit_offset']))
+        if 'enum_names' in patch:
+            enum_names = getattr(element, 'enum_names', {})
+            for usage, names in patch['enum_names'].items():
+                for value, name in names.items():
+                    enum_names[(usage, value)] = name
+            element.enum_names = enum_names
+        if 'rename' in patch:
+            self._rename(path, element, patch['rename'])
+
+    def apply_all(self, patches):
+        for patch in patches:
+            self.apply(patch)
+
+
+def apply_patch_files(peripherals, filenames):
+    """Apply the patches of the files in the given order to the model"""
+    patcher = ModelPatcher(peripherals)
+    for filename in filenames:
+        patches = load_patches(filename)
+        logger.info("Applying {} patches of {}".format(len(patches), filename))
+        patcher.apply_all(patches)
+    return peripherals
@@ -1,4 +1,12 @@
-import PyPDF2
+import mmap
+import os
+import shutil
+import tempfile
+
+from atomic_file import atomic_write
+
+# PyPDF2 is imported on demand, see Document._reader(). Generating the svd
+# from the cached model must not pay for loading the pdf stack.
 
 
 class Chapter:
@@ -41,6 +49,14 @@ class Chapter:
                 return page
         return None
 
+    def get_register_chapters(self):
+        if ' Registers' in self.name:
+            return [self]
+        result = []
+        for chapter in self.chapter:
+            result.extend(chapter.get_register_chapters())
+        return result
+
     def __str__(self):
         result = "Chapter '{}' pg. {}\n".format(self.name, self.page)
         for v in self.chapter:
@@ -72,6 +88,12 @@ class Manual:
                 return page
         return None
 
+    def get_register_chapters(self):
+        result = []
+        for chapter in self.chapter:
+            result.extend(chapter.get_register_chapters())
+        return result
+
     def get_description_for_register(self, peripheral_name, register_name):
         for chapter in self.chapter:
             desc = chapter.get_description_for_register(peripheral_name, register_name)
@@ -88,13 +110,95 @@ class Manual:
 
 
 class Document:
-    def __init__(self, filename):
+    """Session on the reference manual
+
+    The pdf file is opened and memory mapped once, its cross-reference table is
+    only parsed once. Every page needed by an extraction stage is written once
+    as single page pdf file to the page directory, which is shared with the
+    worker processes. Pickled copies of a document, e.g. in worker processes,
+    open the file again on their first use, but reuse the page files.
+    """
+
+    def __init__(self, filename, page_directory=None):
         self.filename = filename
+        self.owns_page_directory = page_directory is None
+        self.page_directory = page_directory if page_directory else tempfile.mkdtemp(prefix='sim3u-pages-')
+        self._file = None
+        self._mmap = None
+        self._pdf = None
+
+    def __getstate__(self):
+        return {'filename': self.filename, 'page_directory': self.page_directory}
+
+    def __setstate__(self, state):
+        self.filename = state['filename']
+        self.page_directory = state['page_directory']
+        self.owns_page_directory = False
+        self._file = None
+        self._mmap = None
+        self._pdf = None
+
+    def _reader(self):
+        if self._pdf is None:
+            import PyPDF2
+
+            self._file = open(self.filename, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._pdf = PyPDF2.PdfFileReader(self._mmap)
+        return self._pdf
+
+    def close(self):
+        self._pdf = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.owns_page_directory:
+            shutil.rmtree(self.page_directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_num_pages(self):
+        return self._reader().getNumPages()
+
+    def page_filename(self, page):
+        """Return the filename of a pdf file containing only the given page (starting at 1)
+
+        The file name follows the naming of camelot, which derives the page number from it.
+        """
+        filename = os.path.join(self.page_directory, "page-{}.pdf".format(page))
+        if os.path.exists(filename):
+            return filename
+
+        import PyPDF2
+
+        writer = PyPDF2.PdfFileWriter()
+        writer.addPage(self._reader().getPage(page - 1))
+        # other processes might read the page at the same time
+        with atomic_write(filename, sync=False) as f:
+            writer.write(f)
+        return filename
+
+    def split_pages(self, pages):
+        """Write the single page files of a page range [first, last] in advance
+
+        Workers that get a pickled copy of the document then don't have to open the pdf.
+        """
+        for page in range(pages[0], pages[-1] + 1):
+            self.page_filename(page)
 
     def _store_toc(self, pdf, outlines, parent, indent=""):
+        from PyPDF2.generic import Destination
+
         chapter = parent
         for o in outlines:
-            if isinstance(o, PyPDF2.generic.Destination):
+            if isinstance(o, Destination):
                 # print("{}Destination {} pg. {}".format(indent, o.title, pdf.getDestinationPageNumber(o)))
                 chapter = Chapter(o.title, pdf.getDestinationPageNumber(o) + 1)
                 parent.add_chapter(chapter)
@@ -104,7 +208,7 @@ class Document:
                 raise Exception("Unexpected content in toc")
 
     def parse_toc(self):
-        pdf = PyPDF2.PdfFileReader(open(self.filename, "rb"))
+        pdf = self._reader()
         print("{} has {} pages.".format(self.filename, pdf.getNumPages()))
         outlines = pdf.getOutlines()
 
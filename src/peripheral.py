@@ -7,6 +7,23 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# first entry of the exception vectors of a Cortex-M, the interrupts follow
+FIRST_INTERRUPT_VECTOR = 16
+
+
+class Interrupt:
+    def __init__(self, content):
+        """Create from a row of the interrupt vector table: position, priority, name, description, address"""
+        self.index = int(content[0])
+        self.name = content[2].replace(' ', '_')
+        self.description = content[3]
+        self.address = int(content[4], 0)
+
+    @classmethod
+    def from_index(cls, index, name, description=''):
+        """Create from the interrupt number only, e.g. of an svd file, the vector address follows from it"""
+        return cls([str(index), '', name, description, hex((FIRST_INTERRUPT_VECTOR + index) * 4)])
+
 
 class Peripheral:
     def __init__(self, name):
@@ -18,6 +35,7 @@ class Peripheral:
         self.block_size = 0
         self.interrupts = []
         self.derived_from = None
+        self.pages = None  # pages of the register description in the manual
 
     def add_register(self, register):
         register.peripheral = self
@@ -0,0 +1,141 @@
+#!/bin/env python3
+"""Progress reporting and metrics export of the extraction
+
+The extraction code counts events (tables, retries, cache hits, ...) in the
+process local counters. Stages are executed with run_counted(), which
+returns the counter increments of the stage together with its result, so
+that the counts of worker processes end up in the Progress of the
+scheduling process. The metrics can be written in the Prometheus textfile
+format.
+"""
+
+import collections
+import logging
+import time
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+counters = collections.Counter()
+
+# called with the page number when the extraction of a page starts, see supervisor
+page_listener = None
+
+METRICS_PREFIX = 'sim3u_svd'
+
+
+def count(name, n=1):
+    counters[name] += n
+
+
+def page_started(page):
+    if page_listener is not None:
+        page_listener(page)
+
+
+def run_counted(function, args):
+    """Call function(*args), return the result, the duration and the counter increments"""
+    before = counters.copy()
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+    return result, duration, counters - before
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "{}h{:02d}m{:02d}s".format(hours, minutes, seconds)
+    return "{}m{:02d}s".format(minutes, seconds)
+
+
+class Progress:
+    def __init__(self, total_pages, metrics_filename=None, interval=5.0):
+        self.total_pages = total_pages
+        self.metrics_filename = metrics_filename
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = None
+        self.pages_done = 0
+        self.peripherals_total = None
+        self.peripherals_done = 0
+        self.counters = collections.Counter()
+        self.stage_durations = collections.Counter()
+        self.stage_counts = collections.Counter()
+
+    def set_total_pages(self, total_pages):
+        self.total_pages = total_pages
+
+    def set_total_peripherals(self, total):
+        self.peripherals_total = total
+
+    def stage_done(self, kind, pages, duration, stage_counters):
+        """Account a finished stage of the given kind (e.g. 'registers') that processed pages"""
+        self.pages_done += pages
+        self.counters.update(stage_counters)
+        self.stage_durations[kind] += duration
+        self.stage_counts[kind] += 1
+        if kind == 'registers':
+            self.peripherals_done += 1
+        now = time.perf_counter()
+        if self.last_report is None or now - self.last_report >= self.interval:
+            self.report()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def eta(self):
+        if not self.pages_done:
+            return None
+        remaining = max(self.total_pages - self.pages_done, 0)
+        return self.elapsed() / self.pages_done * remaining
+
+    def tables_per_second(self):
+        elapsed = self.elapsed()
+        return self.counters['tables'] / elapsed if elapsed else 0.0
+
+    def peripherals_remaining(self):
+        if self.peripherals_total is None:
+            return None
+        return self.peripherals_total - self.peripherals_done
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        eta = self.eta()
+        remaining = self.peripherals_remaining()
+        logger.info("Progress: {}/{} pages, {:.2f} tables/s, {} peripherals remaining, ETA {}".format(
+            self.pages_done, self.total_pages, self.tables_per_second(),
+            "?" if remaining is None else remaining,
+            "?" if eta is None else format_duration(eta)))
+        if self.metrics_filename:
+            self.write_metrics()
+
+    def _metrics(self):
+        eta = self.eta()
+        yield 'pages_processed_total', 'counter', 'Pages of the manual processed', [('', self.pages_done)]
+        yield 'pages', 'gauge', 'Pages of the manual to process', [('', self.total_pages)]
+        yield 'peripherals_processed_total', 'counter', 'Peripherals with extracted registers', \
+            [('', self.peripherals_done)]
+        yield 'elapsed_seconds', 'gauge', 'Time since the start of the extraction', [('', self.elapsed())]
+        yield 'eta_seconds', 'gauge', 'Estimated time until the extraction is done', \
+            [('', eta if eta is not None else float('nan'))]
+        yield 'events_total', 'counter', 'Extraction events, e.g. tables, retries, cache hits', \
+            [('{{event="{}"}}'.format(name), value) for name, value in sorted(self.counters.items())]
+        yield 'stage_duration_seconds_total', 'counter', 'Summed duration of the stages by kind', \
+            [('{{stage="{}"}}'.format(kind), value) for kind, value in sorted(self.stage_durations.items())]
+        yield 'stages_total', 'counter', 'Finished stages by kind', \
+            [('{{stage="{}"}}'.format(kind), value) for kind, value in sorted(self.stage_counts.items())]
+
+    def write_metrics(self):
+        """Write the metrics atomically in the Prometheus textfile format"""
+        lines = []
+        for name, metric_type, help_text, samples in self._metrics():
+            name = "{}_{}".format(METRICS_PREFIX, name)
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for labels, value in samples:
+                lines.append("{}{} {}".format(name, labels, value))
+        with atomic_write(self.metrics_filename, 'w', sync=False) as f:
+            f.write("\n".join(lines) + "\n")
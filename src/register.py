@@ -16,6 +16,9 @@ class RegisterBits:
 
 
 class Register:
+    # postfix, address offset and flag of the SET, CLR and MSK registers
+    SPECIAL_REGISTERS = (('SET', 4, 'has_set'), ('CLR', 8, 'has_clr'), ('MSK', 0xC, 'has_msk'))
+
     def __init__(self, name, title, address, has_set=False, has_clr=False, has_msk=False):
         self.name = name
         self.title = title
@@ -31,6 +34,7 @@ class Register:
         self.is_cluster = False
         self.header_struct_name = None
         self.peripheral = None
+        self.page = None  # page of the bit overview table in the manual
 
     def set_bits(self, bits):
         self.bits = bits
@@ -41,14 +45,12 @@ class Register:
     def set_read_action(self, read_action):
         self.read_action = read_action
 
+    def special_registers(self):
+        """Postfix and address offset of the SET, CLR and MSK registers this register has"""
+        return [(postfix, offset) for postfix, offset, flag in self.SPECIAL_REGISTERS if getattr(self, flag)]
+
     def max_address(self):
-        if self.has_msk:
-            return self.address + 0xC
-        if self.has_clr:
-            return self.address + 8
-        if self.has_set:
-            return self.address + 4
-        return self.address
+        return self.address + max([0] + [offset for postfix, offset in self.special_registers()])
 
     def _xml_append_special(self, parent_element, parent_address, postfix, offset):
         r = ET.SubElement(parent_element, 'register')
@@ -72,7 +74,12 @@ class Register:
         ET.SubElement(r, 'dataType').text = data_type
 
     def xml_append(self, registers_element, parent_address):
-        self.reset_value, self.reset_mask = self.bits.calc_reset_values() if self.bits else (0, 0)
+        if self.bits:
+            self.reset_value, self.reset_mask = self.bits.calc_reset_values()
+        else:
+            # keep the values of an earlier call, the bits of a single 32 bit field are cleared below
+            self.reset_value = self.reset_value or 0
+            self.reset_mask = self.reset_mask or 0
 
         if self.bits and self.bits.has_only_one_32bit_field():
             # get description
@@ -110,12 +117,8 @@ class Register:
             self._xml_append_to_cluster(r, 'U16', None, 'uint16_t', 'U32')
             self._xml_append_to_cluster(r, 'U8', None, 'uint8_t', 'U32')
 
-        if self.has_set:
-            self._xml_append_special(registers_element, parent_address, 'SET', 4)
-        if self.has_clr:
-            self._xml_append_special(registers_element, parent_address, 'CLR', 8)
-        if self.has_msk:
-            self._xml_append_special(registers_element, parent_address, 'MSK', 0xC)
+        for postfix, offset in self.special_registers():
+            self._xml_append_special(registers_element, parent_address, postfix, offset)
 
     def __str__(self):
         return "Register {0}\t\t {1:#010X}\t{2} {3} {4}\n\t\t{5}\n".format(self.name, self.address, self.has_set,
@@ -144,7 +147,9 @@ class EnumValue:
 
 class RegisterBitTableEntry:
     def __init__(self, column):
-        self.column = column
+        # keep only the plain cell strings, a pandas Series in the pickled
+        # model would pull in pandas when loading the cache
+        self.column = [str(column[i]) for i in range(4)]
         self.bits = []
         self.name = ""
         self.access = ""
@@ -153,6 +158,7 @@ class RegisterBitTableEntry:
         self.description = ""
         self.enum_values = {'read': [], 'write': [], 'read-write': []}
         self.usage = None  # defaults to read-write when none given
+        self.enum_names = dict()  # names of enum values by (usage, value), overriding the generated ones
         self._parse_column()
 
     def _parse_column(self):
@@ -227,15 +233,18 @@ class RegisterBitTableEntry:
         return reset_value, reset_mask
 
     def _parse_function(self):
+        """Return the description and the enum values of the function text"""
         p1 = re.compile(r'([0,1]+)(-([0,1]+))?:\s*(.*)')
         p2 = re.compile(r'\s*(.+)')
-        print("\nParsing function for {}".format(self.name))
+        logger.debug("Parsing function for {}".format(self.name))
         # print(self.function)
         rw_mode = 'read-write'
+        description = self.description
+        enum_values = {'read': [], 'write': [], 'read-write': []}
         for i, line in enumerate(self.function.splitlines()):
             # print("Line {}: '{}'".format(i, line))
             if i == 0:
-                self.description = line.strip()
+                description = line.strip()
                 continue
             if line.strip() == 'Read:':
                 rw_mode = 'read'
@@ -245,22 +254,36 @@ class RegisterBitTableEntry:
                 continue
             m = p1.match(line)
             if m:
-                self.enum_values[rw_mode].append(EnumValue("0b" + m.group(1), m.group(4)))
+                enum_values[rw_mode].append(EnumValue("0b" + m.group(1), m.group(4)))
                 # TODO handle m.group(3) if it is there
                 continue
             m = p2.match(line)
-            if m and self.enum_values[rw_mode]:
-                enum_value = self.enum_values[rw_mode][-1]
+            if m and enum_values[rw_mode]:
+                enum_value = enum_values[rw_mode][-1]
                 enum_value.description += m.group(1)
+        return description, enum_values
 
-    def _name_enum_values(self):
-        for key, enum_values in self.enum_values.items():
-            for enum_value in enum_values:
+    def _name_enum_values(self, enum_values):
+        enum_names = getattr(self, 'enum_names', {})
+        for key, values in enum_values.items():
+            for enum_value in values:
                 enum_value.try_name_value(key)
+                if (key, enum_value.value) in enum_names:
+                    enum_value.name = enum_names[(key, enum_value.value)]
+
+    def parse_enum_values(self):
+        """Return the named enum values of the function text without storing them in the entry"""
+        description, enum_values = self._parse_function()
+        self._name_enum_values(enum_values)
+        return enum_values
+
+    def get_enum_values(self):
+        self.description, self.enum_values = self._parse_function()
+        self._name_enum_values(self.enum_values)
+        return self.enum_values
 
     def xml_append(self, fields_element):
-        self._parse_function()
-        self._name_enum_values()
+        self.get_enum_values()
         if self.name == 'Reserved':
             # To remove WARNING M361 from SVDConv:
             # Field name 'Reserved': 'RESERVED' items must not be defined.
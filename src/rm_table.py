@@ -5,34 +5,39 @@ class RmTable:
     def __init__(self, table):
         self.table = table
 
-    def is_bit_overview(self):
+    def _cell(self, column, row):
+        # badly detected tables can be smaller than expected
         df = self.table.df
-        if df[0][0] != 'Bit':
+        if column not in df.columns or row not in df.index:
+            return None
+        return df[column][row]
+
+    def is_bit_overview(self):
+        if self._cell(0, 0) != 'Bit':
             return False
-        if df[0][1] != 'Name':
+        if self._cell(0, 1) != 'Name':
             return False
-        if df[0][2] != 'Type':
+        if self._cell(0, 2) != 'Type':
             return False
-        if df[0][3] != 'Reset':
+        if self._cell(0, 3) != 'Reset':
             return False
 
-        if df[0][5] != 'Bit':
+        if self._cell(0, 5) != 'Bit':
             return False
-        if df[0][6] != 'Name':
+        if self._cell(0, 6) != 'Name':
             return False
-        if df[0][7] != 'Type':
+        if self._cell(0, 7) != 'Type':
             return False
-        if df[0][8] != 'Reset':
+        if self._cell(0, 8) != 'Reset':
             return False
         return True
 
     def is_bit_description(self):
-        df = self.table.df
-        if df[0][0] != 'Bit':
+        if self._cell(0, 0) != 'Bit':
             return False
-        if df[1][0] != 'Name':
+        if self._cell(1, 0) != 'Name':
             return False
-        if df[2][0] != 'Function':
+        if self._cell(2, 0) != 'Function':
             return False
 
         return True
@@ -0,0 +1,277 @@
+#!/bin/env python3
+"""Fast table extraction from the text layer and the vector rulings of a page
+
+The tables of the reference manual are drawn with vector lines. Instead of
+rendering the page and detecting the lines in the image, like the lattice
+flavor of camelot does, the grid is built directly from the line and
+rectangle objects of the page. Text is assigned to the cells with the same
+rules camelot uses, so the resulting data frames can be used by the same
+parsers: a text line goes into the cell it overlaps most, and if that cell is
+part of a merged cell (an internal ruling is missing), the text is moved to
+the left and then the top cell of the merged cell, like camelot's set_span()
+and _reduce_index(shift_text=['l', 't']) do. The name of a field that spans
+several bits therefore lands in the column of its highest bit.
+
+Only pages whose tables match the known templates (register bit overview
+and bit description) are handled here, all other pages must be extracted
+with camelot.
+"""
+
+import logging
+
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTLine, LTRect, LTTextLineHorizontal
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+import progress
+from rm_table import RmTable
+
+logger = logging.getLogger(__name__)
+
+# maximum distance in points of line ends that still touch each other
+LINE_TOLERANCE = 2
+# maximum thickness in points of a rectangle that is drawn as line
+RULING_THICKNESS = 2
+
+# same layout parameters as camelot uses
+LAYOUT_PARAMETERS = dict(char_margin=1.0, line_margin=0.5, word_margin=0.1, detect_vertical=True, all_texts=True)
+
+BITS_31_16 = [str(b) for b in range(31, 15, -1)]
+BITS_15_0 = [str(b) for b in range(15, -1, -1)]
+
+
+class TemplateMismatch(Exception):
+    pass
+
+
+class RuledTable:
+    """Table built from the rulings of a page, provides the attributes of a camelot table used here"""
+
+    def __init__(self, page, bbox, data):
+        import pandas
+
+        self.page = str(page)
+        self.bbox = bbox
+        self.data = data
+        self.df = pandas.DataFrame(data)
+
+
+def _cluster(values):
+    """Merge coordinates that are closer than LINE_TOLERANCE"""
+    clustered = []
+    for v in sorted(values):
+        if clustered and v - clustered[-1][-1] <= LINE_TOLERANCE:
+            clustered[-1].append(v)
+        else:
+            clustered.append([v])
+    return [sum(c) / len(c) for c in clustered]
+
+
+def _segments(layout):
+    horizontal = []
+    vertical = []
+    for obj in layout:
+        if not isinstance(obj, (LTLine, LTRect)):
+            continue
+        x0, y0, x1, y1 = obj.bbox
+        if y1 - y0 <= RULING_THICKNESS and x1 - x0 > RULING_THICKNESS:
+            horizontal.append(((y0 + y1) / 2, x0, x1))
+        elif x1 - x0 <= RULING_THICKNESS and y1 - y0 > RULING_THICKNESS:
+            vertical.append(((x0 + x1) / 2, y0, y1))
+        elif isinstance(obj, LTRect):
+            horizontal.extend([(y0, x0, x1), (y1, x0, x1)])
+            vertical.extend([(x0, y0, y1), (x1, y0, y1)])
+    return horizontal, vertical
+
+
+def _text_lines(layout):
+    lines = []
+    for obj in layout:
+        if isinstance(obj, LTTextLineHorizontal):
+            lines.append(obj)
+        elif hasattr(obj, '__iter__'):
+            lines.extend(_text_lines(obj))
+    return lines
+
+
+def _grids(horizontal, vertical):
+    """Group touching segments into grids, returns lists of (horizontal, vertical) segments"""
+    parent = list(range(len(horizontal) + len(vertical)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    t = LINE_TOLERANCE
+    for hi, (y, hx0, hx1) in enumerate(horizontal):
+        for vi, (x, vy0, vy1) in enumerate(vertical):
+            if hx0 - t <= x <= hx1 + t and vy0 - t <= y <= vy1 + t:
+                parent[find(hi)] = find(len(horizontal) + vi)
+
+    groups = dict()
+    for i in range(len(parent)):
+        h, v = groups.setdefault(find(i), ([], []))
+        if i < len(horizontal):
+            h.append(horizontal[i])
+        else:
+            v.append(vertical[i - len(horizontal)])
+    return [g for g in groups.values() if len(g[0]) >= 2 and len(g[1]) >= 2]
+
+
+def _table_index(rows, cols, line):
+    """Cell of a text line, by the same rules as camelot's get_table_index"""
+    x0, y0, x1, y1 = line.bbox
+    y_center = (y0 + y1) / 2.0
+    for r, (top, bottom) in enumerate(rows):
+        if not bottom < y_center < top:
+            continue
+        overlap = []
+        for left, right in cols:
+            if left <= x1 and right >= x0:
+                overlap.append((min(right, x1) - max(left, x0)) / (right - left))
+            else:
+                overlap.append(-1)
+        if max(overlap) == -1:
+            return None
+        return r, overlap.index(max(overlap))
+    return None
+
+
+def _covered(segments, position, start, end):
+    """True if one of the segments lies at position and covers start to end"""
+    t = LINE_TOLERANCE
+    return any(abs(p - position) <= t and s0 - t <= start and s1 + t >= end for p, s0, s1 in segments)
+
+
+def _cell_edges(rows, cols, horizontal, vertical):
+    """Ruled edges (left, right, top, bottom) of every cell, the border of the table counts as ruled"""
+    edges = []
+    for r, (top, bottom) in enumerate(rows):
+        row = []
+        for c, (left, right) in enumerate(cols):
+            row.append((c == 0 or _covered(vertical, left, bottom, top),
+                        c == len(cols) - 1 or _covered(vertical, right, bottom, top),
+                        r == 0 or _covered(horizontal, top, left, right),
+                        r == len(rows) - 1 or _covered(horizontal, bottom, left, right)))
+        edges.append(row)
+    return edges
+
+
+def _span(edges):
+    """Return (hspan, vspan) of a cell, by the same rules as camelot's set_span"""
+    left, right, top, bottom = edges
+    bound = left + right + top + bottom
+    if bound == 4:
+        return False, False
+    if bound == 3:
+        hspan = not left or not right
+        return hspan, not hspan
+    if bound == 2:
+        return top and bottom and not left and not right, left and right and not top and not bottom
+    return True, True
+
+
+def _shift_text(edges, r, c):
+    """Move the index of a text line to the left and then to the top cell of a merged cell"""
+    hspan, vspan = _span(edges[r][c])
+    if hspan:
+        while c > 0 and not edges[r][c][0]:
+            c -= 1
+    # camelot checks the span of the cell reached by the left shift
+    hspan, vspan = _span(edges[r][c])
+    if vspan:
+        while r > 0 and not edges[r][c][2]:
+            r -= 1
+    return r, c
+
+
+def _build_table(page, horizontal, vertical, text_lines):
+    xs = _cluster([v[0] for v in vertical])
+    ys = _cluster([h[0] for h in horizontal])
+    if len(xs) < 2 or len(ys) < 2:
+        return None
+    cols = list(zip(xs[:-1], xs[1:]))
+    ys.reverse()
+    rows = list(zip(ys[:-1], ys[1:]))
+    bbox = (xs[0], ys[-1], xs[-1], ys[0])
+    edges = _cell_edges(rows, cols, horizontal, vertical)
+
+    data = [['' for c in cols] for r in rows]
+    # same order as camelot: top to bottom, then left to right
+    for line in sorted(text_lines, key=lambda t: (-t.y0, t.x0)):
+        if not (bbox[0] <= (line.x0 + line.x1) / 2 <= bbox[2] and bbox[1] <= (line.y0 + line.y1) / 2 <= bbox[3]):
+            continue
+        index = _table_index(rows, cols, line)
+        if index is None:
+            continue
+        r, c = _shift_text(edges, *index)
+        data[r][c] += line.get_text()
+    data = [[cell.strip() for cell in row] for row in data]
+    return RuledTable(page, bbox, data)
+
+
+def _check_template(table):
+    """Raise TemplateMismatch if a table looks like a register table, but does not match the template"""
+    rm_table = RmTable(table)
+    if rm_table.is_bit_description():
+        if len(table.data[0]) != 3:
+            raise TemplateMismatch("Bit description on pg. {} has {} columns".format(table.page, len(table.data[0])))
+        return True
+    if rm_table.is_bit_overview():
+        # the parser needs the row after the reset values of bits 15..0
+        if len(table.data) < 10 or len(table.data[0]) != 17:
+            raise TemplateMismatch("Bit overview on pg. {} has {}x{} cells".format(
+                table.page, len(table.data), len(table.data[0])))
+        if table.data[0][1:] != BITS_31_16 or table.data[5][1:] != BITS_15_0:
+            raise TemplateMismatch("Bit overview on pg. {} has unexpected bit columns".format(table.page))
+        return True
+    if table.data[0][0] == 'Bit':
+        raise TemplateMismatch("Unknown register table on pg. {}".format(table.page))
+    return False
+
+
+def _page_tables(page, layout):
+    horizontal, vertical = _segments(layout)
+    text_lines = _text_lines(layout)
+    tables = []
+    for h, v in _grids(horizontal, vertical):
+        table = _build_table(page, h, v, text_lines)
+        if table is not None and _check_template(table):
+            tables.append(table)
+
+    # every bit overview has two 'Bit' labels, every bit description one, more of them
+    # on the page means that a register table was not found in the rulings
+    labels = len([line for line in text_lines if line.get_text().strip() == 'Bit'])
+    found = sum(2 if RmTable(t).is_bit_overview() else 1 for t in tables)
+    if labels > found:
+        raise TemplateMismatch("Register table on pg. {} without rulings".format(page))
+
+    # same order as camelot: top to bottom
+    tables.sort(key=lambda t: -t.bbox[3])
+    return tables
+
+
+def read_ruled_tables(document, pages):
+    """Return the register tables of the pages by page number
+
+    Pages that cannot be handled are missing in the result and must be
+    extracted with the generic extractor.
+    """
+    resource_manager = PDFResourceManager()
+    device = PDFPageAggregator(resource_manager, laparams=LAParams(**LAYOUT_PARAMETERS))
+    interpreter = PDFPageInterpreter(resource_manager, device)
+
+    result = dict()
+    for page in pages:
+        progress.page_started(page)
+        with open(document.page_filename(page), 'rb') as f:
+            for pdf_page in PDFPage.get_pages(f):
+                interpreter.process_page(pdf_page)
+                try:
+                    result[page] = _page_tables(page, device.get_result())
+                except TemplateMismatch as e:
+                    logger.info("Using generic extractor: {}".format(e))
+    return result
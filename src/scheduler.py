@@ -0,0 +1,145 @@
+#!/bin/env python3
+"""Small scheduler for the stages of the extraction pipeline
+
+Every stage declares the names of its inputs and outputs. A stage is started
+as soon as all of its inputs are available, independent stages run
+concurrently in a process pool. Stages can be added while the scheduler is
+running, e.g. from the on_done callback of another stage.
+"""
+
+import collections
+import concurrent.futures
+import logging
+
+from progress import run_counted
+
+logger = logging.getLogger(__name__)
+
+
+class StageAborted(Exception):
+    """Raised for a stage that could not finish, the exception becomes the value of its outputs"""
+
+
+class Stage:
+    def __init__(self, name, function, args=(), inputs=(), outputs=None, on_done=None):
+        """Create a stage
+
+        function is called with args followed by the values of the inputs. It must
+        return one value per output, as tuple if there are more than one.
+        outputs defaults to the name of the stage. on_done(scheduler, stage, values)
+        is called in the scheduling process when the stage has finished.
+        """
+        self.name = name
+        self.function = function
+        self.args = args
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs) if outputs is not None else (name,)
+        self.on_done = on_done
+
+
+class StageScheduler:
+    def __init__(self, max_workers=1, on_stage_done=None, executor=None):
+        """max_workers of 1 executes all stages in the calling process
+
+        on_stage_done(stage, duration, counters) is called for every finished stage with
+        the counter increments of the stage, see progress.run_counted(). An executor,
+        e.g. a supervisor.SupervisedExecutor, is used instead of a process pool.
+        """
+        self.max_workers = max_workers
+        self.on_stage_done = on_stage_done
+        self.executor = executor
+        self.stages = []
+        self.results = dict()
+        self.durations = dict()
+        self._producers = dict()
+
+    def add_stage(self, stage):
+        for output in stage.outputs:
+            if output in self._producers:
+                raise Exception("Output {} of stage {} is already produced by stage {}".format(
+                    output, stage.name, self._producers[output]))
+            self._producers[output] = stage.name
+        self.stages.append(stage)
+
+    def provide(self, name, value):
+        """Make a value available as input without a stage"""
+        self._producers[name] = None
+        self.results[name] = value
+
+    def _pop_ready_stages(self):
+        ready = [s for s in self.stages if all(i in self.results for i in s.inputs)]
+        for s in ready:
+            self.stages.remove(s)
+        return ready
+
+    def _stage_args(self, stage):
+        return tuple(stage.args) + tuple(self.results[i] for i in stage.inputs)
+
+    def _finish_stage(self, stage, result, duration, counters):
+        values = (result,) if len(stage.outputs) == 1 else tuple(result)
+        if len(values) != len(stage.outputs):
+            raise Exception("Stage {} returned {} values for outputs {}".format(
+                stage.name, len(values), stage.outputs))
+        for output, value in zip(stage.outputs, values):
+            self.results[output] = value
+        self.durations[stage.name] = duration
+        logger.debug("Stage {} done in {:.1f}s".format(stage.name, duration))
+        if self.on_stage_done:
+            self.on_stage_done(stage, duration, counters)
+        if stage.on_done:
+            stage.on_done(self, stage, values)
+
+    def _check_progress(self, running):
+        if running or not self.stages:
+            return
+        missing = ["{} needs {}".format(s.name, [i for i in s.inputs if i not in self.results])
+                   for s in self.stages]
+        raise Exception("Stages cannot be started, inputs are missing: {}".format(", ".join(missing)))
+
+    def _run_inline(self):
+        while self.stages:
+            ready = self._pop_ready_stages()
+            self._check_progress(ready)
+            for stage in ready:
+                try:
+                    result, duration, counters = run_counted(stage.function, self._stage_args(stage))
+                except StageAborted as e:
+                    self._abort_stage(stage, e)
+                    continue
+                self._finish_stage(stage, result, duration, counters)
+
+    def _abort_stage(self, stage, error):
+        logger.error("Stage {} aborted: {}".format(stage.name, error))
+        result = error if len(stage.outputs) == 1 else (error,) * len(stage.outputs)
+        self._finish_stage(stage, result, 0.0, collections.Counter())
+
+    def _run_pool(self, executor):
+        running = dict()
+        while self.stages or running:
+            for stage in self._pop_ready_stages():
+                future = executor.submit(run_counted, stage.function, self._stage_args(stage))
+                running[future] = stage
+            self._check_progress(running)
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    result, duration, counters = future.result()
+                except StageAborted as e:
+                    self._abort_stage(stage, e)
+                    continue
+                self._finish_stage(stage, result, duration, counters)
+
+    def run(self):
+        """Run all stages, including the ones added while running, and return the results
+
+        Outputs of stages that raised StageAborted have the exception as value.
+        """
+        if self.executor is not None:
+            self._run_pool(self.executor)
+        elif self.max_workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                self._run_pool(executor)
+        else:
+            self._run_inline()
+        return self.results
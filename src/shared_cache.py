@@ -0,0 +1,167 @@
+#!/bin/env python3
+"""Cache directory shared by concurrent processes
+
+Every entry is a file with a header holding a checksum of its content.
+Entries are written into a temporary file in the same directory and renamed
+into place, readers see either the old or the new entry, never a partial
+one. An entry whose checksum does not match is treated as missing.
+
+Every entry has its own lock file. get_or_create() computes a missing entry
+with the lock held, other processes that want the same entry wait for it
+and load the result instead of computing it again.
+
+PageCache holds the rendered pages and the detected lines of the extractor.
+It is defined here, without the camelot imports of the extractor, so the
+model can be taken from the cache without loading the extraction stack.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+
+from atomic_file import atomic_write
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SIM3UCACHE1\n'
+DIGEST_SIZE = 64  # hex digits of sha256
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_cache_entry(filename):
+    """True if the file is an entry of a SharedCache"""
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class EntryLock:
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = None
+
+    def acquire(self):
+        """Blocks while another process holds the lock"""
+        if fcntl is None:
+            return
+        self.fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def release(self):
+        if self.fd is not None:
+            # closing the file releases the lock
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedCache:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if fcntl is None:
+            logger.warning("File locking is not available, concurrent runs may compute entries twice")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read_bytes(self, name):
+        """Return the content of the entry or None if it is missing or damaged"""
+        try:
+            with open(self._path(name), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+        header_size = len(MAGIC) + DIGEST_SIZE + 1
+        if not data.startswith(MAGIC) or len(data) < header_size:
+            logger.warning("Ignoring cache entry {} without header".format(name))
+            return None
+        digest = data[len(MAGIC):header_size - 1].decode()
+        content = data[header_size:]
+        if hashlib.sha256(content).hexdigest() != digest:
+            logger.warning("Ignoring damaged cache entry {}".format(name))
+            return None
+        return content
+
+    def write_bytes(self, name, content):
+        header = MAGIC + hashlib.sha256(content).hexdigest().encode() + b'\n'
+        with atomic_write(self._path(name)) as f:
+            f.write(header)
+            f.write(content)
+
+    def load(self, name):
+        content = self.read_bytes(name)
+        if content is None:
+            return None
+        try:
+            return pickle.loads(content)
+        except Exception as e:
+            logger.warning("Ignoring cache entry {}: {}".format(name, e))
+            return None
+
+    def save(self, name, value):
+        self.write_bytes(name, pickle.dumps(value))
+
+    def lock(self, name):
+        """Return the lock of the entry, use it with the with statement or acquire() and release()"""
+        return EntryLock(self._path(name + '.lock'))
+
+    def get_or_create(self, name, create):
+        """Load the entry, or compute it with create() if no process did so before"""
+        value = self.load(name)
+        if value is not None:
+            return value
+        with self.lock(name):
+            # another process may have created it while we were waiting for the lock
+            value = self.load(name)
+            if value is None:
+                value = create()
+                self.save(name, value)
+        return value
+
+
+class PageCache(SharedCache):
+    """Rendered pages and detected lines by page content, can be shared by concurrent runs"""
+
+    def _image_name(self, page_key, resolution):
+        return "{}-r{}.png".format(page_key, resolution)
+
+    def load_image(self, page_key, resolution, imagename):
+        content = self.read_bytes(self._image_name(page_key, resolution))
+        if content is None:
+            return False
+        with open(imagename, 'wb') as f:
+            f.write(content)
+        return True
+
+    def save_image(self, page_key, resolution, imagename):
+        with open(imagename, 'rb') as f:
+            self.write_bytes(self._image_name(page_key, resolution), f.read())
+
+    def geometry_name(self, page_key, parameters):
+        parameter_key = hashlib.sha1(repr(parameters).encode()).hexdigest()[:16]
+        return "{}-{}.geometry".format(page_key, parameter_key)
+
+    def load_geometry(self, page_key, parameters):
+        return self.load(self.geometry_name(page_key, parameters))
+
+    def save_geometry(self, page_key, parameters, geometry):
+        self.save(self.geometry_name(page_key, parameters), geometry)
@@ -0,0 +1,212 @@
+#!/bin/env python3
+"""Worker processes with a time and memory limit per page
+
+The extraction reports the page it starts with progress.page_started(). The
+supervisor watches every busy worker: if a page takes longer than the page
+timeout or the worker (together with its child processes, e.g. ghostscript)
+uses more memory than the RSS limit, the worker is killed and a new one is
+started. The job fails with WorkerKilled, which names the offending page.
+
+SupervisedExecutor has the submit() interface of concurrent.futures
+executors, so the StageScheduler can use it instead of a process pool.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import time
+
+import progress
+from scheduler import StageAborted
+
+logger = logging.getLogger(__name__)
+
+# seconds between two checks of the busy workers
+CHECK_INTERVAL = 0.5
+
+
+class WorkerKilled(StageAborted):
+    def __init__(self, message, page=None):
+        super().__init__(message)
+        self.page = page
+
+
+def _rss(pid):
+    """Resident memory of a process and all of its children in bytes, None if unknown"""
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            rss = next((int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:')), 0)
+        children = []
+        for task in os.listdir('/proc/{}/task'.format(pid)):
+            with open('/proc/{}/task/{}/children'.format(pid, task)) as f:
+                children.extend(int(c) for c in f.read().split())
+    except (OSError, ValueError):
+        return None
+    return rss + sum(_rss(c) or 0 for c in children)
+
+
+def _worker_main(connection, page, page_start):
+    def page_listener(p):
+        page.value = p
+        page_start.value = time.time()
+
+    progress.page_listener = page_listener
+    while True:
+        message = connection.recv()
+        if message is None:
+            return
+        job_id, function, args = message
+        try:
+            result = function(*args)
+        except Exception as e:
+            try:
+                connection.send((job_id, False, e))
+            except Exception:
+                # the exception cannot be pickled
+                connection.send((job_id, False, Exception("{}: {}".format(type(e).__name__, e))))
+            continue
+        connection.send((job_id, True, result))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.page = context.Value('i', -1, lock=False)
+        self.page_start = context.Value('d', 0.0, lock=False)
+        self.process = context.Process(target=_worker_main, args=(child_connection, self.page, self.page_start),
+                                       daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.job = None
+
+    def start_job(self, job_id, function, args, future):
+        self.page.value = -1
+        self.page_start.value = time.time()
+        self.job = (job_id, future)
+        self.connection.send((job_id, function, args))
+
+    def current_page(self):
+        return self.page.value if self.page.value >= 0 else None
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.connection.close()
+
+
+class SupervisedExecutor:
+    def __init__(self, max_workers=1, page_timeout=None, rss_limit=None):
+        """page_timeout in seconds per page, rss_limit in bytes, None disables the limit"""
+        self.max_workers = max_workers
+        self.page_timeout = page_timeout
+        self.rss_limit = rss_limit
+        self.context = multiprocessing.get_context()
+        self.workers = [_Worker(self.context) for i in range(max_workers)]
+        self.pending = collections.deque()
+        self.next_job_id = 0
+        self.shutdown_requested = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._supervise, daemon=True)
+        self.thread.start()
+        if rss_limit is not None and _rss(os.getpid()) is None:
+            logger.warning("Memory usage of processes is not available, the RSS limit is not checked")
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.pending.append((self.next_job_id, function, args, future))
+            self.next_job_id += 1
+        return future
+
+    def _dispatch(self):
+        with self.lock:
+            for worker in self.workers:
+                if worker.job is None and self.pending:
+                    job_id, function, args, future = self.pending.popleft()
+                    if future.set_running_or_notify_cancel():
+                        worker.start_job(job_id, function, args, future)
+
+    def _receive(self, worker):
+        try:
+            job_id, ok, value = worker.connection.recv()
+        except (EOFError, OSError):
+            self._replace(worker, "Worker process died")
+            return
+        future = worker.job[1]
+        worker.job = None
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _replace(self, worker, reason):
+        page = worker.current_page()
+        message = "{} on pg. {}".format(reason, page if page is not None else "?")
+        logger.error("{}, restarting the worker".format(message))
+        worker.kill()
+        future = worker.job[1] if worker.job else None
+        self.workers[self.workers.index(worker)] = _Worker(self.context)
+        if future is not None:
+            future.set_exception(WorkerKilled(message, page))
+
+    def _check_limits(self, worker):
+        if self.page_timeout is not None and time.time() - worker.page_start.value > self.page_timeout:
+            self._replace(worker, "Page timeout of {}s exceeded".format(self.page_timeout))
+            return
+        if self.rss_limit is not None:
+            rss = _rss(worker.process.pid)
+            if rss is not None and rss > self.rss_limit:
+                self._replace(worker, "RSS limit exceeded with {} MB".format(rss // (1024 * 1024)))
+
+    def _supervise(self):
+        while True:
+            self._dispatch()
+            busy = [w for w in self.workers if w.job is not None]
+            if not busy:
+                with self.lock:
+                    if self.shutdown_requested and not self.pending:
+                        return
+                time.sleep(CHECK_INTERVAL / 10)
+                continue
+            handles = [w.connection for w in busy] + [w.process.sentinel for w in busy]
+            ready = multiprocessing.connection.wait(handles, CHECK_INTERVAL)
+            for worker in busy:
+                if worker.connection in ready:
+                    self._receive(worker)
+                elif worker.process.sentinel in ready:
+                    self._replace(worker, "Worker process died")
+                else:
+                    self._check_limits(worker)
+
+    def shutdown(self, cancel_futures=False):
+        """Wait for the jobs and stop the workers, with cancel_futures the jobs not started yet are cancelled"""
+        with self.lock:
+            self.shutdown_requested = True
+            if cancel_futures:
+                for job in self.pending:
+                    job[3].cancel()
+                self.pending.clear()
+        self.thread.join()
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
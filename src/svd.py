@@ -2,10 +2,15 @@ import logging
 import sys
 import xml.etree.ElementTree as ET
 
+from svd_arrays import fold_peripheral
+from svd_shards import write_shards
+
 logger = logging.getLogger(__name__)
 
 
 def setup_logger():
+    if logger.handlers:
+        return
     handler = logging.StreamHandler(sys.stdout)
     logger.setLevel(logging.INFO)
     formatter = logging.Formatter(
@@ -15,14 +20,15 @@ def setup_logger():
 
 
 class SvdGenerator:
-    def __init__(self, peripherals):
+    def __init__(self, peripherals, dim_arrays=True):
+        """dim_arrays folds repeated registers into dim arrays, see svd_arrays"""
         setup_logger()
         self.peripherals = peripherals
+        self.dim_arrays = dim_arrays
 
-    def generate(self, svd_filename):
-        # pyxb.RequireValidWhenGenerating(False)
+    def build_device(self):
+        """Return the device element without the peripherals"""
         device = ET.Element('device', attrib={'schemaVersion': '1.1'})
-        svd = ET.ElementTree(device)
 
         ET.SubElement(device, 'name').text = "SiM3U167_B"
         ET.SubElement(device, 'version').text = "1"
@@ -42,19 +48,41 @@ class SvdGenerator:
         ET.SubElement(device, 'width').text = "32"
         ET.SubElement(device, 'size').text = "32"
         ET.SubElement(device, 'access').text = "read-write"
+        return device
 
-        p_element = ET.SubElement(device, 'peripherals')
-
+    def serialization_order(self):
+        """Return the peripherals in the order of the svd file, base peripherals before derived ones"""
+        order = []
         serialized = set()
         for p_n, p in self.peripherals.items():
             if p.derived_from and (p.derived_from not in serialized):
-                self.peripherals[p.derived_from].xml_append(p_element)
+                order.append(self.peripherals[p.derived_from])
                 serialized.add(p.derived_from)
             if p.name not in serialized:
-                p.xml_append(p_element)
+                order.append(p)
                 serialized.add(p.name)
+        return order
+
+    def build(self):
+        # pyxb.RequireValidWhenGenerating(False)
+        device = self.build_device()
+        svd = ET.ElementTree(device)
+
+        p_element = ET.SubElement(device, 'peripherals')
+        for p in self.serialization_order():
+            p.xml_append(p_element)
+            if self.dim_arrays:
+                fold_peripheral(p_element[-1])
         # for p_n, p in self.peripherals.items():
         #    print("Peripheral: {}".format(p_n))
         #    print(p.get_xml())
 
+        return svd
+
+    def generate(self, svd_filename):
+        svd = self.build()
         svd.write(svd_filename, encoding="utf-8", xml_declaration=True)
+
+    def generate_shards(self, directory, jobs=1):
+        """Write one file per peripheral and the index device.svd into directory, see svd_shards"""
+        write_shards(self, directory, jobs)
@@ -0,0 +1,158 @@
+#!/bin/env python3
+"""Fold repeated registers of a svd file into dim arrays and expand them again
+
+Registers and clusters that differ only in a number in their name and in
+their address offset, at a constant stride, are written as one element with
+dim, dimIncrement and dimIndex, e.g. CH%s_CONFIG. The name keeps the %s
+without brackets, so header generators still create the same register
+names as for the single elements.
+"""
+
+import copy
+import re
+import xml.etree.ElementTree as ET
+
+ARRAY_ELEMENTS = ('register', 'cluster')
+DIM_ELEMENTS = ('dim', 'dimIncrement', 'dimIndex')
+
+_number = re.compile(r'\d+')
+
+
+def _offset(element):
+    return int(element.findtext('addressOffset'), 0)
+
+
+def _layout(element):
+    """Serialized element without its name and offset, equal for elements of the same array"""
+    e = copy.copy(element)
+    for child in list(e):
+        if child.tag in ('name', 'addressOffset'):
+            e.remove(child)
+    return ET.tostring(e)
+
+
+def _candidates(name):
+    """Yield (pattern, index) for every number in the name"""
+    for m in _number.finditer(name):
+        yield name[:m.start()] + '%s' + name[m.end():], m.group()
+
+
+def _runs(members):
+    """Split the members of a group into runs with a constant stride, members are (index, offset, element)"""
+    members = sorted(members, key=lambda m: int(m[0]))
+    runs = []
+    run = []
+    for m in members:
+        if run:
+            stride = m[1] - run[-1][1]
+            if stride <= 0 or (len(run) > 1 and stride != run[1][1] - run[0][1]):
+                runs.append(run)
+                run = []
+        run.append(m)
+    runs.append(run)
+    return [r for r in runs if len(r) > 1]
+
+
+def _array_element(pattern, run):
+    first = run[0][2]
+    e = copy.deepcopy(first)
+    e.find('name').text = pattern
+    ET.SubElement(e, 'dim').text = str(len(run))
+    ET.SubElement(e, 'dimIncrement').text = hex(run[1][1] - run[0][1])
+    ET.SubElement(e, 'dimIndex').text = ",".join(m[0] for m in run)
+    # the dim elements come first in the schema
+    for i, tag in enumerate(DIM_ELEMENTS):
+        child = e.find(tag)
+        e.remove(child)
+        e.insert(i, child)
+    return e
+
+
+def fold_arrays(registers_element):
+    """Replace runs of equal registers and clusters in registers_element by dim arrays"""
+    groups = dict()
+    for e in registers_element:
+        if e.tag not in ARRAY_ELEMENTS or e.find('dim') is not None:
+            continue
+        layout = _layout(e)
+        for pattern, index in _candidates(e.findtext('name')):
+            groups.setdefault((pattern, layout), []).append((index, _offset(e), e))
+
+    replacements = dict()
+    # larger groups first, every element can only be part of one array
+    for (pattern, _), members in sorted(groups.items(), key=lambda g: -len(g[1])):
+        members = [m for m in members if id(m[2]) not in replacements]
+        for run in _runs(members):
+            replacements[id(run[0][2])] = _array_element(pattern, run)
+            for m in run[1:]:
+                replacements[id(m[2])] = None
+
+    if not replacements:
+        return
+    children = []
+    for e in registers_element:
+        replacement = replacements.get(id(e), e)
+        if replacement is not None:
+            children.append(replacement)
+    registers_element[:] = children
+
+
+def fold_peripheral(peripheral_element):
+    registers_element = peripheral_element.find('registers')
+    if registers_element is not None:
+        fold_arrays(registers_element)
+
+
+def _expand(element):
+    dim = int(element.findtext('dim'), 0)
+    increment = int(element.findtext('dimIncrement'), 0)
+    index_text = element.findtext('dimIndex')
+    if index_text:
+        if '-' in index_text and ',' not in index_text:
+            first, last = index_text.split('-')
+            if first.isdigit():
+                indexes = [str(i) for i in range(int(first), int(last) + 1)]
+            else:
+                indexes = [chr(c) for c in range(ord(first), ord(last) + 1)]
+        else:
+            indexes = [i.strip() for i in index_text.split(',')]
+    else:
+        indexes = [str(i) for i in range(dim)]
+    name = element.findtext('name')
+    offset = _offset(element)
+    elements = []
+    for i, index in enumerate(indexes[:dim]):
+        e = copy.deepcopy(element)
+        for tag in DIM_ELEMENTS:
+            child = e.find(tag)
+            if child is not None:
+                e.remove(child)
+        e.find('name').text = name.replace('[%s]', index).replace('%s', index)
+        e.find('addressOffset').text = hex(offset + i * increment)
+        elements.append(e)
+    return elements
+
+
+def expand_arrays(registers_element):
+    """Replace the dim arrays in registers_element (a registers or cluster element) by single elements"""
+    children = []
+    expanded = False
+    for e in registers_element:
+        if e.tag in ARRAY_ELEMENTS and e.find('dim') is not None:
+            children.extend(_expand(e))
+            expanded = True
+        else:
+            children.append(e)
+    if expanded:
+        # back into the order of the addresses, as the generator writes them
+        children.sort(key=lambda e: _offset(e) if e.find('addressOffset') is not None else 0)
+    for e in children:
+        if e.tag == 'cluster':
+            expand_arrays(e)
+    registers_element[:] = children
+
+
+def expand_peripheral(peripheral_element):
+    registers_element = peripheral_element.find('registers')
+    if registers_element is not None:
+        expand_arrays(registers_element)
@@ -0,0 +1,144 @@
+#!/bin/env python3
+"""Structural diff of two svd files
+
+Every peripheral, register, cluster, field and enumerated value is stored in
+an index under its path, e.g. UART0/CONFIG/EN/read-write/0b1, together with
+its simple properties (name, offsets, reset values, ...). Derived peripherals
+get the entries of the peripheral they are derived from, dim arrays are
+expanded into single registers. Two indexes are compared in a single pass
+over their paths.
+"""
+
+import collections
+import os
+import xml.etree.ElementTree as ET
+
+from svd_arrays import expand_peripheral
+
+CONTAINERS = ('registers', 'fields', 'addressBlock', 'cpu')
+CHILD_ELEMENTS = ('register', 'cluster', 'field', 'enumeratedValues')
+
+
+def _properties(element):
+    properties = dict()
+    for child in element:
+        if len(child) or child.tag in CONTAINERS or child.tag in CHILD_ELEMENTS:
+            continue
+        if child.tag in ('interrupt', 'addressBlock'):
+            continue
+        properties[child.tag] = (child.text or '').strip()
+    properties.update(("@" + k, v) for k, v in element.attrib.items())
+    return properties
+
+
+def _child_elements(element):
+    for child in element:
+        if child.tag in ('registers', 'fields'):
+            yield from _child_elements(child)
+        elif child.tag in CHILD_ELEMENTS:
+            yield child
+
+
+def _index_element(index, path, element):
+    index[path] = _properties(element)
+    if element.tag == 'enumeratedValues':
+        for ev in element.iter('enumeratedValue'):
+            value = ev.findtext('value', '').strip()
+            index["{}/{}".format(path, value)] = _properties(ev)
+        return
+    for child in _child_elements(element):
+        if child.tag == 'enumeratedValues':
+            name = child.findtext('usage', 'read-write').strip()
+        else:
+            name = child.findtext('name', '').strip()
+        _index_element(index, "{}/{}".format(path, name), child)
+
+
+def _index_peripheral(element):
+    """Return the entries of a peripheral with paths relative to it, '' is the peripheral itself"""
+    expand_peripheral(element)
+    index = {'': _properties(element)}
+    for child in element.findall('addressBlock'):
+        index["addressBlock/{}".format(child.findtext('offset', '').strip())] = _properties(child)
+    for child in element.findall('interrupt'):
+        index["interrupt/{}".format(child.findtext('name', '').strip())] = _properties(child)
+    for child in _child_elements(element):
+        _index_element(index, child.findtext('name', '').strip(), child)
+    return index
+
+
+def index_svd(root):
+    """Create the path index of the device element root"""
+    peripherals = root.find('peripherals')
+    elements = [] if peripherals is None else peripherals.findall('peripheral')
+    by_name = collections.OrderedDict()
+    for p in elements:
+        by_name[p.findtext('name', '').strip()] = (p, _index_peripheral(p))
+
+    resolved = dict()
+
+    def resolve(name, seen=()):
+        if name in resolved:
+            return resolved[name]
+        p, own = by_name[name]
+        base = p.get('derivedFrom')
+        if base and base in by_name and base not in seen:
+            # inherit everything but the interrupts from the base peripheral,
+            # own values take precedence
+            entries = {path: properties for path, properties in resolve(base, seen + (name,)).items()
+                       if not path.startswith('interrupt/')}
+            entries[''] = dict(entries[''], **own[''])
+            entries.update((path, properties) for path, properties in own.items() if path)
+        else:
+            entries = own
+        resolved[name] = entries
+        return entries
+
+    index = dict()
+    for name in by_name:
+        for path, properties in resolve(name).items():
+            index[name + '/' + path if path else name] = properties
+    return index
+
+
+def load_svd_index(svd_filename):
+    """Index a svd file or the directory of a sharded svd, see svd_shards"""
+    if os.path.isdir(svd_filename):
+        from svd_shards import SvdShards
+        return index_svd(SvdShards(svd_filename).join().getroot())
+    return index_svd(ET.parse(svd_filename).getroot())
+
+
+class SvdDiff:
+    def __init__(self, old_index, new_index):
+        self.added = []
+        self.removed = []
+        self.changed = []
+        for path, properties in old_index.items():
+            if path not in new_index:
+                self.removed.append(path)
+                continue
+            new_properties = new_index[path]
+            if properties != new_properties:
+                keys = sorted(set(properties) | set(new_properties))
+                changes = [(k, properties.get(k), new_properties.get(k)) for k in keys
+                           if properties.get(k) != new_properties.get(k)]
+                self.changed.append((path, changes))
+        for path in new_index:
+            if path not in old_index:
+                self.added.append(path)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self):
+        lines = []
+        for path in self.removed:
+            lines.append("- {}".format(path))
+        for path in self.added:
+            lines.append("+ {}".format(path))
+        for path, changes in self.changed:
+            for key, old, new in changes:
+                lines.append("~ {} {}: {} -> {}".format(path, key, old, new))
+        lines.append("{} added, {} removed, {} changed".format(len(self.added), len(self.removed), len(self.changed)))
+        return "\n".join(lines)
@@ -0,0 +1,189 @@
+#!/bin/env python3
+"""Rebuild the peripheral model from an existing svd file
+
+The file is read with iterparse, every peripheral is converted as soon as
+its element is complete and then dropped from the tree. The model is the
+same as after the extraction from the manual, so it can be written again
+with the SvdGenerator or used by any other transformation:
+
+- derived peripherals get copies of the registers of their base peripheral
+  (without fields, like after the extraction), shifted to their base address
+- dim arrays are expanded into single registers
+- the _SET/_CLR/_MSK registers are folded into the flags of their register
+- registers without fields get a single 32 bit entry, as extracted from the
+  manual, clusters keep their header struct name
+- the enumerated values are converted back into the function text of the
+  field, from which the generator derives them, names that differ from the
+  derived ones are kept in the enum_names of the field
+"""
+
+import collections
+import logging
+import xml.etree.ElementTree as ET
+
+from peripheral import Interrupt, Peripheral
+from register import Register, RegisterBitTableEntry, RegisterBitTableEntryCollection
+from svd_arrays import expand_peripheral
+
+logger = logging.getLogger(__name__)
+
+
+def _text(element, tag, default=None):
+    text = element.findtext(tag)
+    return text.strip() if text is not None else default
+
+
+def _int(element, tag, default=0):
+    text = _text(element, tag)
+    return int(text, 0) if text else default
+
+
+def _bits_column(bits, reset_value, name, access):
+    return [" ".join(str(b) for b in bits), name, access, " ".join(str((reset_value >> b) & 1) for b in bits)]
+
+
+def _contiguous_runs(bits):
+    """Split descending bit numbers into runs of contiguous bits"""
+    runs = []
+    for b in bits:
+        if runs and runs[-1][-1] == b + 1:
+            runs[-1].append(b)
+        else:
+            runs.append([b])
+    return runs
+
+
+def _function_text(description, enumerated_values):
+    """Function text of the manual, as parsed by RegisterBitTableEntry._parse_function()"""
+    lines = [description or ""]
+    for usage in ('read-write', 'read', 'write'):
+        values = enumerated_values.get(usage)
+        if not values:
+            continue
+        if usage == 'read':
+            lines.append("Read:")
+        elif usage == 'write':
+            lines.append("Write:")
+        for value, value_description in values:
+            lines.append("{}: {}".format(value[2:], value_description))
+    return "\n".join(lines)
+
+
+def _load_field(register_reset_value, f):
+    offset = _int(f, 'bitOffset')
+    width = _int(f, 'bitWidth', 1)
+    bits = list(range(offset + width - 1, offset - 1, -1))
+    entry = RegisterBitTableEntry(_bits_column(bits, register_reset_value, _text(f, 'name', ''),
+                                               _text(f, 'access', '')))
+    enumerated_values = dict()
+    names = dict()
+    for evs in f.findall('enumeratedValues'):
+        usage = _text(evs, 'usage', 'read-write')
+        values = enumerated_values.setdefault(usage, [])
+        for ev in evs.findall('enumeratedValue'):
+            value = _text(ev, 'value', '')
+            values.append((value, _text(ev, 'description', '')))
+            names[(usage, value)] = _text(ev, 'name', '')
+    entry.add_info(_function_text(_text(f, 'description', ''), enumerated_values))
+    if names:
+        for usage, derived_values in entry.parse_enum_values().items():
+            for ev in derived_values:
+                name = names.get((usage, ev.value))
+                if name is not None and name != ev.name:
+                    entry.enum_names[(usage, ev.value)] = name
+    return entry
+
+
+def _load_register(base_address, r):
+    name = _text(r, 'name')
+    register = Register(name, _text(r, 'description'), base_address + _int(r, 'addressOffset'))
+    register.description = _text(r, 'description')
+    register.read_action = _text(r, 'readAction')
+    reset_value = _int(r, 'resetValue')
+    register.reset_value = reset_value
+    register.reset_mask = _int(r, 'resetMask')
+    if r.tag == 'cluster':
+        register.is_cluster = True
+        register.header_struct_name = _text(r, 'headerStructName')
+        register.read_action = _text(r.find('register'), 'readAction') if r.find('register') is not None else None
+
+    bits = RegisterBitTableEntryCollection()
+    fields = r.find('fields')
+    if fields is not None:
+        for f in fields.findall('field'):
+            bits.entries.append(_load_field(reset_value, f))
+        # Reserved fields are not written to the svd file, restore them from the reset mask
+        covered = set(b for e in bits.entries for b in e.bits)
+        reserved = [b for b in range(31, -1, -1) if (register.reset_mask >> b) & 1 and b not in covered]
+        for run in _contiguous_runs(reserved):
+            bits.entries.append(RegisterBitTableEntry(_bits_column(run, reset_value, 'Reserved', 'R')))
+        # the entries of the bit overview are ordered from bit 31 to bit 0
+        bits.entries.sort(key=lambda e: -e.bits[0])
+    elif register.reset_mask == 0xFFFFFFFF:
+        # a single 32 bit field, which is removed when generating the svd
+        entry = RegisterBitTableEntry(_bits_column(list(range(31, -1, -1)), reset_value, name, 'RW'))
+        entry.add_info(register.description or "")
+        bits.entries.append(entry)
+    register.set_bits(bits)
+    return register
+
+
+def _load_peripheral(p):
+    peripheral = Peripheral(_text(p, 'name'))
+    peripheral.derived_from = p.get('derivedFrom')
+    description = _text(p, 'description')
+    peripheral.description = description if description else "None"
+    if _text(p, 'headerStructName'):
+        peripheral.header_struct_name = _text(p, 'headerStructName')
+    peripheral.base_address = _int(p, 'baseAddress')
+
+    for i in p.findall('interrupt'):
+        index = _int(i, 'value')
+        peripheral.add_interrupt(Interrupt.from_index(index, _text(i, 'name'), _text(i, 'description', '')))
+
+    registers = p.find('registers')
+    elements = [] if registers is None else [r for r in registers if r.tag in ('register', 'cluster')]
+    offsets = dict((_text(r, 'name'), _int(r, 'addressOffset')) for r in elements)
+    specials = []
+    for r in elements:
+        name = _text(r, 'name')
+        # only a register at the offset of the SET/CLR/MSK register of its base register is folded
+        special = [s for s in Register.SPECIAL_REGISTERS
+                   if name.endswith('_' + s[0]) and name[:-len(s[0]) - 1] in offsets and
+                   _int(r, 'addressOffset') == offsets[name[:-len(s[0]) - 1]] + s[1]]
+        if special and r.find('fields') is None:
+            specials.append((name[:-len(special[0][0]) - 1], special[0][2]))
+            continue
+        peripheral.add_register(_load_register(peripheral.base_address, r))
+
+    for name, flag in specials:
+        setattr(peripheral.registers[name], flag, True)
+    return peripheral
+
+
+def _derive_registers(peripheral, base):
+    """Copy the registers of the base peripheral, like the memory map lists them for every instance"""
+    for r in base.registers.values():
+        register = Register(r.name, r.title, r.address - base.base_address + peripheral.base_address,
+                            r.has_set, r.has_clr, r.has_msk)
+        peripheral.add_register(register)
+
+
+def load_svd(svd_filename):
+    """Return the peripherals of the svd file by name"""
+    peripherals = collections.OrderedDict()
+    for event, element in ET.iterparse(svd_filename, events=('end',)):
+        if element.tag != 'peripheral':
+            continue
+        expand_peripheral(element)
+        peripheral = _load_peripheral(element)
+        peripherals[peripheral.name] = peripheral
+        element.clear()
+
+    for p in peripherals.values():
+        if p.derived_from:
+            if p.derived_from not in peripherals:
+                logger.warning("Peripheral {} is derived from unknown {}".format(p.name, p.derived_from))
+                continue
+            _derive_registers(p, peripherals[p.derived_from])
+    return peripherals
@@ -0,0 +1,113 @@
+#!/bin/env python3
+"""Svd output with one file per peripheral
+
+The directory contains the index file device.svd and one file NAME.svd per
+peripheral with its peripheral element. The index has the same device
+header as the monolithic svd file and lists every peripheral with its name,
+base address and derivedFrom attribute, in the order of the monolithic file.
+Derived peripherals are stored like in the monolithic file, the registers
+are in the file of the peripheral they are derived from.
+
+The files of the peripherals are serialized as independent stages, so they
+can be written concurrently. Joining the files gives the same svd as
+SvdGenerator.generate().
+"""
+
+import collections
+import logging
+import os
+import xml.etree.ElementTree as ET
+
+from atomic_file import atomic_write
+from scheduler import Stage, StageScheduler
+from svd_arrays import fold_peripheral
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'device.svd'
+
+
+def shard_filename(directory, name):
+    return os.path.join(directory, name + '.svd')
+
+
+def _write_tree(tree, filename):
+    with atomic_write(filename) as f:
+        tree.write(f, encoding="utf-8", xml_declaration=True)
+
+
+def _write_shard(peripheral, filename, dim_arrays):
+    """Serialize a peripheral into its own file, return its base address"""
+    peripherals_element = ET.Element('peripherals')
+    peripheral.xml_append(peripherals_element)
+    if dim_arrays:
+        fold_peripheral(peripherals_element[0])
+    _write_tree(ET.ElementTree(peripherals_element[0]), filename)
+    return peripheral.base_address
+
+
+def write_shards(generator, directory, jobs=1):
+    """Write the peripherals of the SvdGenerator into directory, using jobs processes"""
+    os.makedirs(directory, exist_ok=True)
+    order = generator.serialization_order()
+
+    scheduler = StageScheduler(max_workers=jobs)
+    for p in order:
+        args = (p, shard_filename(directory, p.name), generator.dim_arrays)
+        scheduler.add_stage(Stage('shard_' + p.name, _write_shard, args))
+    results = scheduler.run()
+
+    device = generator.build_device()
+    peripherals_element = ET.SubElement(device, 'peripherals')
+    for p in order:
+        attrib = {'derivedFrom': p.derived_from} if p.derived_from else {}
+        e = ET.SubElement(peripherals_element, 'peripheral', attrib=attrib)
+        ET.SubElement(e, 'name').text = p.name
+        ET.SubElement(e, 'baseAddress').text = hex(results['shard_' + p.name])
+    _write_tree(ET.ElementTree(device), os.path.join(directory, INDEX_FILENAME))
+    logger.info("Wrote {} peripheral files to {}".format(len(order), directory))
+
+
+class SvdShards:
+    """Reader of a sharded svd, the files of the peripherals are parsed when they are first used"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.device = ET.parse(os.path.join(directory, INDEX_FILENAME)).getroot()
+        self.index = collections.OrderedDict()
+        for e in self.device.find('peripherals').findall('peripheral'):
+            self.index[e.findtext('name')] = e
+        self._loaded = dict()
+
+    def names(self):
+        return list(self.index)
+
+    def derived_from(self, name):
+        return self.index[name].get('derivedFrom')
+
+    def peripheral(self, name):
+        """Return the peripheral element as stored in its file"""
+        if name not in self._loaded:
+            self._loaded[name] = ET.parse(shard_filename(self.directory, name)).getroot()
+        return self._loaded[name]
+
+    def resolve(self, name):
+        """Return the peripheral element and the elements it is derived from, nearest first"""
+        elements = []
+        seen = set()
+        while name and name not in seen:
+            seen.add(name)
+            elements.append(self.peripheral(name))
+            name = self.derived_from(name)
+        return elements
+
+    def join(self):
+        """Return the ElementTree of the monolithic svd file"""
+        device = ET.Element(self.device.tag, attrib=self.device.attrib)
+        for child in self.device:
+            if child.tag != 'peripherals':
+                device.append(child)
+        peripherals_element = ET.SubElement(device, 'peripherals')
+        for name in self.index:
+            peripherals_element.append(self.peripheral(name))
+        return ET.ElementTree(device)
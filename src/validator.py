@@ -0,0 +1,156 @@
+#!/bin/env python3
+"""Semantic checks of the peripheral model before the svd file is written
+
+The checks cover what SVDConv would complain about: overlapping peripherals,
+registers and fields, reset values outside the reset mask and duplicated
+enumerated values. Overlaps are found with a sort and a single sweep over the
+intervals. The checks do not change the model, the svd file is the same
+whether the validation ran or not.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationProblem:
+    def __init__(self, message, pages=None):
+        self.message = message
+        self.pages = pages
+
+    def __str__(self):
+        if self.pages:
+            return "{} (pg. {})".format(self.message, self.pages)
+        return self.message
+
+
+def find_overlaps(intervals):
+    """Return all pairs of overlapping intervals
+
+    intervals is a list of (start, end, item) with end being exclusive.
+    """
+    overlaps = []
+    active = []  # intervals that may still overlap, sorted by start
+    for interval in sorted(intervals, key=lambda i: (i[0], i[1])):
+        active = [a for a in active if a[1] > interval[0]]
+        for a in active:
+            overlaps.append((a, interval))
+        active.append(interval)
+    return overlaps
+
+
+def _register_pages(register):
+    page = getattr(register, 'page', None)
+    if page:
+        return page
+    if register.peripheral is not None:
+        return getattr(register.peripheral, 'pages', None)
+    return None
+
+
+class SvdValidator:
+    def __init__(self, peripherals):
+        self.peripherals = peripherals
+        self.problems = []
+
+    def _report(self, message, pages=None):
+        self.problems.append(ValidationProblem(message, pages))
+
+    def _register_intervals(self, register):
+        intervals = [(register.address, register.address + 4, register.name)]
+        for postfix, offset in register.special_registers():
+            start = register.address + offset
+            intervals.append((start, start + 4, register.name + '_' + postfix))
+        return intervals
+
+    def _validate_peripherals(self):
+        intervals = []
+        for p in self.peripherals.values():
+            if not p.registers:
+                self._report("Peripheral {} has no registers".format(p.name), getattr(p, 'pages', None))
+                continue
+            # the address block as Peripheral._calc_xml_values() computes it
+            start = min(r.address for r in p.registers.values())
+            end = max(r.max_address() for r in p.registers.values()) + 4
+            intervals.append((start, end, p))
+
+        for a, b in find_overlaps(intervals):
+            self._report("Peripherals {} and {} overlap at {:#010x}".format(a[2].name, b[2].name, b[0]))
+
+    def _validate_registers(self, peripheral):
+        intervals = []
+        for r in peripheral.registers.values():
+            intervals.extend(self._register_intervals(r))
+
+        for a, b in find_overlaps(intervals):
+            self._report("Registers {}_{} and {}_{} overlap at {:#010x}".format(
+                peripheral.name, a[2], peripheral.name, b[2], b[0]),
+                getattr(peripheral, 'pages', None))
+
+    def _validate_fields(self, peripheral, register):
+        name = "{}_{}".format(peripheral.name, register.name)
+        pages = _register_pages(register)
+        intervals = []
+        for e in register.bits.entries:
+            if not e.bits:
+                self._report("Field {}.{} has no bits".format(name, e.name), pages)
+                continue
+            if max(e.bits) > 31 or min(e.bits) < 0:
+                self._report("Field {}.{} is outside of the register: bits {}".format(name, e.name, e.bits),
+                             pages)
+            if sorted(e.bits, reverse=True) != list(range(max(e.bits), min(e.bits) - 1, -1)):
+                self._report("Field {}.{} has non contiguous bits {}".format(name, e.name, e.bits), pages)
+            intervals.append((min(e.bits), max(e.bits) + 1, e))
+
+        for a, b in find_overlaps(intervals):
+            self._report("Fields {}.{} and {}.{} overlap at bit {}".format(
+                name, a[2].name, name, b[2].name, b[0]), pages)
+
+        reset_value, reset_mask = register.bits.calc_reset_values()
+        if reset_value & ~reset_mask:
+            self._report("Register {} reset value {:#010x} is outside of reset mask {:#010x}".format(
+                name, reset_value, reset_mask), pages)
+
+    def _validate_enum_values(self, peripheral, register):
+        name = "{}_{}".format(peripheral.name, register.name)
+        pages = _register_pages(register)
+        for e in register.bits.entries:
+            if e.name == 'Reserved':
+                continue
+            width = max(e.bits) - min(e.bits) + 1 if e.bits else 0
+            for usage, enum_values in e.parse_enum_values().items():
+                values = set()
+                names = set()
+                for ev in enum_values:
+                    try:
+                        value = int(ev.value[2:], 2)
+                    except ValueError:
+                        self._report("Field {}.{} has {} enum value {} that is no binary number".format(
+                            name, e.name, usage, ev.value), pages)
+                        continue
+                    if value in values:
+                        self._report("Field {}.{} has duplicated {} enum value {}".format(
+                            name, e.name, usage, ev.value), pages)
+                    if value >= (1 << width):
+                        self._report("Field {}.{} enum value {} does not fit into {} bits".format(
+                            name, e.name, ev.value, width), pages)
+                    if ev.name in names:
+                        self._report("Field {}.{} has duplicated {} enum name {}".format(
+                            name, e.name, usage, ev.name), pages)
+                    values.add(value)
+                    names.add(ev.name)
+
+    def validate(self):
+        """Run all checks and return the list of problems found"""
+        self.problems = []
+        self._validate_peripherals()
+        for p in self.peripherals.values():
+            if p.derived_from or not p.registers:
+                continue
+            self._validate_registers(p)
+            for r in p.registers.values():
+                if not r.bits:
+                    continue
+                self._validate_fields(p, r)
+                self._validate_enum_values(p, r)
+        return self.problems